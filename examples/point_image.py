@@ -1,7 +1,9 @@
+import math
+
+import numpy as np
 from PIL import Image
 
 from pyautonifty.constants import DRAWING_SIZE
-from pyautonifty.helper_fns import rotate
 from pyautonifty.pos import Pos
 from pyautonifty.drawing import Drawing
 from pyautonifty.renderer import Renderer
@@ -37,27 +39,27 @@ def point_image(drawing, image_name, do_a_shuffle=False,
         x_offset = 0
         y_offset = 0
 
-    for x in range(pixel_width):
-        for y in range(pixel_height):
-            colour = list(rgba_image.getpixel((x, y)))
-            colour[3] /= 255
-
-            # Do the initial position calculation
-            px = (x + 0.5 + x_offset) * x_diff
-            py = (y + 0.5 + y_offset) * y_diff
+    # Pixel colours in the same x-major order as looping over x then y, alpha scaled to 0..1
+    colours = np.asarray(rgba_image, dtype=np.float64).transpose(1, 0, 2).reshape(-1, 4)
+    colours[:, 3] /= 255
 
-            # Adjust the position of the image
-            px += position.x - (width / 2)
-            py += position.y - (height / 2)
+    # Do the initial position calculation for every pixel at once
+    xs, ys = np.meshgrid(np.arange(pixel_width), np.arange(pixel_height), indexing="ij")
+    px = (xs.ravel() + 0.5 + x_offset) * x_diff
+    py = (ys.ravel() + 0.5 + y_offset) * y_diff
 
-            pos = Pos(px, py)
+    # Adjust the position of the image
+    px += position.x - (width / 2)
+    py += position.y - (height / 2)
 
-            # Rotate the position
-            if rotation:
-                pos = rotate(pos, rotation, origin=position)
+    # Rotate the positions
+    if rotation:
+        px, py = px - position.x, py - position.y
+        px, py = (px * math.cos(rotation) - py * math.sin(rotation) + position.x,
+                  px * math.sin(rotation) + py * math.cos(rotation) + position.y)
 
-            pr = max_diff * pow(2, 0.5) / 2
-            drawing.add_point(pos=pos, colour=colour, brush_radius=pr)
+    pr = max_diff * pow(2, 0.5) / 2
+    drawing.add_points(np.column_stack((px, py)), colours, pr)
 
     if do_a_shuffle:
         drawing.shuffle_lines()
@@ -1,8 +1,11 @@
+import math
+
 from pyautonifty import helper_fns, constants
 from pyautonifty.pos import Pos
 from pyautonifty.drawing import Drawing
 from pyautonifty.fractal_runner import fractalRunner
 from pyautonifty.renderer import Renderer
+from pyautonifty.image_renderer import ImageRenderer
 
 from examples.alpha_example import alpha_example
 from examples.curved_lines import curved_lines
@@ -59,6 +62,9 @@ def main():
     # # Most of the methods and examples are in file drawing_methods.py
     # # For the general fractal examples, set it up in fractal_runner.py
 
+    # # Tip - Use Drawing(array_backed=True) for very large drawings, it stores the lines in NumPy arrays and uses
+    # # a fraction of the memory. Everything below works the same on either kind of drawing.
+
     # drawing = point_image(Drawing(), "temp_image.png", do_a_shuffle=False)  # Small image (PNG, JPG supported)
     # drawing = square_image(Drawing(), "temp_image.png", do_a_shuffle=False)  # Sharp pixel corners drawing
     # drawing = text_drawing_example(Drawing(), font_file_name='fonts/OpenSans-Regular.ttf')  # Text with TTF font file
@@ -76,34 +82,67 @@ def main():
     # # Optional - Reduce scale to prevent drawing from touching the edge
     # drawing *= 0.95
 
+    # # Optional - Rotate (radians), translate, or scale the whole drawing about the centre of the canvas
+    # drawing.rotate(math.pi / 8).translate(Pos(20, 0)).scale(0.9, scale_brush=True)
+
+    # # Optional - Remove lines and parts of lines that end up off the canvas, e.g. after zooming in with *=
+    # print(drawing.clip_to_canvas())
+
     # # Optional - Reduce size of your drawing but at the cost of precision.
     # round(drawing)
 
+    # # Optional - Reduce precision and detail step by step until the output fits in a size (in bytes)
+    # print(drawing.fit_to_budget(5 * 1024 ** 2))
+
+    # # Optional - Remove points that make no visible difference, e.g. on curves, fills and text
+    # print(drawing.simplify(tolerance=0.5))
+
+    # # Optional - Remove lines that are completely painted over by later opaque lines
+    # print(drawing.cull_hidden_lines())
+
+    # # Optional - Reorder lines that do not overlap, so the pen travels less as Nifty Ink draws them
+    # # Use method="sweep" for a faster, rougher ordering of drawings with millions of lines
+    # print(drawing.optimise_order())
+
+    # # Optional - Join consecutive lines of the same colour and brush radius, great for dot heavy drawings
+    # # max_gap lets dots that are close together be joined, at the cost of a short stroke between them
+    # print(drawing.merge_lines(max_gap=0))
+
     # # Optional - Save the raw drawing data to a file
-    # drawing.export_raw_data("drawing.ink", indent=4)
+    # drawing.export_raw_data("drawing.ink")
+    # drawing.export_raw_data("drawing.ink", binary=True)  # Compact binary format, very fast to load
 
     # # Optional - Load raw drawing data from a file, overwrites the drawing it is loaded into.
+    # # Binary files are memory-mapped, so cached layers reload almost instantly.
     # drawing.import_raw_data("drawing.ink")
 
     # # Optional - Add a layer from another drawing, adds to the top of the drawing.
+    # # Layers are only copied in when the drawing is written or rendered, so stacking many big layers is cheap.
     # drawing + drawing2
 
     # # Optional - Reverse the drawing order of a drawing
     # reversed(drawing)
 
-    # # Select an import method for the output data
-    output_data = drawing.to_nifty_import()  # Replace previous canvas contents in Nifty.Ink
-    # output_data = drawing.to_nifty_add_layer_import()  # Keep previous canvas contents, write a layer on top
-    # output_data = drawing.to_nifty_show_import() # Show the import and replace previous canvas contents in Nifty.Ink
-
     # # Write the drawing to output file
     # # that can be pasted into the console
     # # in the Developer pane on Nifty Ink website
+    # # The drawing is streamed into the file, so the whole output never has to be held in memory
+    # # compressed=True compresses the drawing in Python, for a much smaller and faster paste into the console
+    with open("output.txt", "w", encoding="utf-8") as file:
+        # # Select an import method for the output data
+        drawing.write_nifty_import(file)  # Replace previous canvas contents in Nifty.Ink
+        # drawing.write_nifty_import(file, compressed=True)  # Replace canvas contents, compressed in Python
+        # drawing.write_nifty_add_layer_import(file)  # Keep previous canvas contents, write a layer on top
+        # drawing.write_nifty_show_import(file)  # Show the import and replace previous canvas contents in Nifty.Ink
+        output_size = file.tell()
+
+    # # Optional - Split a drawing that is too big to import in one go into several files, each up to a size in bytes
+    # # Paste output_001.txt first, it replaces the canvas, then the rest in order, they each add a layer on top
+    # print(drawing.write_nifty_import_parts(2 * 1024 ** 2, "output_{:03d}.txt"))
+
     print(f"Lines: {len(drawing)}, "
-          f"Points: {sum([len(line['points']) for line in drawing])}, "
-          f"Size: {(len(output_data) / 1024.0 ** 2):.2f}MB")
-    with open("output.txt", "w") as file:
-        file.write(output_data)
+          f"Points: {drawing.point_count()}, "
+          f"Size: {(output_size / 1024.0 ** 2):.2f}MB")
 
     # # Optional - Render and save the image in pygame
     # #   increase pygame_scale for higher RES output images
@@ -111,10 +150,13 @@ def main():
     # #   filename specifies the name and format of the image
     # #   simulate specifies whether to show the drawing process
     # #   speed specifies the speed a simulated drawing should be drawn, 3 is roughly equal to the speed that nifty uses
+    # #   fps caps how many times a second the window is refreshed while drawing, fewer refreshes draw faster
+    # #   (0 or None refreshes after every line)
     # #   allow_transparency can be used to enable or disable transparency in the render, it is faster disabled
     # #   fake_transparency is used as an illusion of transparency but only works well with 1 effective layer, very fast
     # #   draw_as_bezier is used to show lines drawn in the exact same method as nifty.ink, slower
     # #   step_size determines the bezier curves effective resolution, higher is slower but often looks better
+    # #   tolerance (in pixels) replaces step_size with just enough points per curve to be that accurate, e.g. 0.25
     # #   save_transparent_bg transparent bg in the pygame screenshot, doesn't work well with transparent lines
     # #   green_screen_colour the colour to use as a green screen for transparent bg, use a colour not in your drawing!
     # #   timestamp_format provides access to a custom timestamp format, refer to datetime's strftime format codes
@@ -130,6 +172,15 @@ def main():
     # Render the traditional way (faster).
     # renderer.render(drawing, filename="screenshot.png")
 
+    # # Optional - Render without pygame or a window, e.g. for thumbnails or batch jobs
+    # ImageRenderer(scale=0.25).render(drawing, filename="thumbnail.png")
+    # # Large renders can be split into tiles rendered in parallel, processes=None uses every CPU
+    # ImageRenderer(scale=8, processes=None).render(drawing, filename="large.png")
+    # # Print sized renders are drawn a band of rows at a time and streamed to the PNG file, using little memory
+    # ImageRenderer(scale=20).render_bands(drawing, filename="print.png")
+    # # Record the drawing being drawn without waiting for it, as numbered frames or an animation file like a GIF
+    # ImageRenderer(scale=0.5).render_animation(drawing, filename="frames/frame_{:05d}.png", fps=30, speed=3)
+
 
 if __name__ == '__main__':
     main()
@@ -1,4 +1,12 @@
 from . import drawing
+from . import line_store
+from . import line_index
+from . import layer
+from . import nifty_json
+from . import lz_string
+from . import ink_format
+from . import polyline_helper_fns
+from . import stroke_order_helper_fns
 from . import pos
 from . import helper_fns
 from . import numpy_helper_fns
@@ -16,4 +24,12 @@ from . import fractal_system
 
 from . import font
 
-from . import renderer
+from . import raster_helper_fns
+from . import png_writer
+from . import image_renderer
+
+# pygame is only needed for the pygame renderer, ImageRenderer works without it
+try:
+    from . import renderer
+except ImportError:
+    pass
@@ -1,29 +1,149 @@
+import io
+import itertools
 import json
 import math
 import random
 
+import numpy as np
+
 from .pos import Pos
-from .helper_fns import get_bezier_curve, rotate
+from .line_store import LineStore, compact_numbers, complete_offsets
+from .line_index import LineIndex
+from .layer import Layer
+from .helper_fns import get_bezier_curves, bezier_step_sizes, rotate, colour_to_string, string_to_colour
 from .constants import DRAWING_SIZE, DEFAULT_BRUSH_RADIUS, MIN_BRUSH_RADIUS, RED
+from . import lz_string
+from .nifty_json import write_nifty_json, to_js_string_literal, points_json_size, line_json_size, \
+    lines_json_size, nifty_lines_size
+from .ink_format import is_ink_file, read_ink_file, write_ink_file
+from .polyline_helper_fns import simplify_line, nifty_curves, polylines_grid_distances, join_lines, \
+    segment_off_canvas, clip_line
+from .stroke_order_helper_fns import stroke_order, travel_distance
+
+# Number of lines converted from LineStore columns at once when generating nifty lines
+NIFTY_LINE_BLOCK_SIZE = 4096
+
+# Use a minified LZString
+# https://raw.githubusercontent.com/pieroxy/lz-string/master/libs/lz-string.min.js
+LZ_STRING = """var LZString=function(){function o(o,r){if(!t[o]){t[o]={};for(var n=0;n<o.length;n++)t[o][o.charAt(n)]=n}return t[o][r]}var r=String.fromCharCode,n="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=",e="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+-$",t={},i={compressToBase64:function(o){if(null==o)return"";var r=i._compress(o,6,function(o){return n.charAt(o)});switch(r.length%4){default:case 0:return r;case 1:return r+"===";case 2:return r+"==";case 3:return r+"="}},decompressFromBase64:function(r){return null==r?"":""==r?null:i._decompress(r.length,32,function(e){return o(n,r.charAt(e))})},compressToUTF16:function(o){return null==o?"":i._compress(o,15,function(o){return r(o+32)})+" "},decompressFromUTF16:function(o){return null==o?"":""==o?null:i._decompress(o.length,16384,function(r){return o.charCodeAt(r)-32})},compressToUint8Array:function(o){for(var r=i.compress(o),n=new Uint8Array(2*r.length),e=0,t=r.length;t>e;e++){var s=r.charCodeAt(e);n[2*e]=s>>>8,n[2*e+1]=s%256}return n},decompressFromUint8Array:function(o){if(null===o||void 0===o)return i.decompress(o);for(var n=new Array(o.length/2),e=0,t=n.length;t>e;e++)n[e]=256*o[2*e]+o[2*e+1];var s=[];return n.forEach(function(o){s.push(r(o))}),i.decompress(s.join(""))},compressToEncodedURIComponent:function(o){return null==o?"":i._compress(o,6,function(o){return e.charAt(o)})},decompressFromEncodedURIComponent:function(r){return null==r?"":""==r?null:(r=r.replace(/ /g,"+"),i._decompress(r.length,32,function(n){return o(e,r.charAt(n))}))},compress:function(o){return i._compress(o,16,function(o){return r(o)})},_compress:function(o,r,n){if(null==o)return"";var e,t,i,s={},p={},u="",c="",a="",l=2,f=3,h=2,d=[],m=0,v=0;for(i=0;i<o.length;i+=1)if(u=o.charAt(i),Object.prototype.hasOwnProperty.call(s,u)||(s[u]=f++,p[u]=!0),c=a+u,Object.prototype.hasOwnProperty.call(s,c))a=c;else{if(Object.prototype.hasOwnProperty.call(p,a)){if(a.charCodeAt(0)<256){for(e=0;h>e;e++)m<<=1,v==r-1?(v=0,d.push(n(m)),m=0):v++;for(t=a.charCodeAt(0),e=0;8>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}else{for(t=1,e=0;h>e;e++)m=m<<1|t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t=0;for(t=a.charCodeAt(0),e=0;16>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}l--,0==l&&(l=Math.pow(2,h),h++),delete p[a]}else for(t=s[a],e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;l--,0==l&&(l=Math.pow(2,h),h++),s[c]=f++,a=String(u)}if(""!==a){if(Object.prototype.hasOwnProperty.call(p,a)){if(a.charCodeAt(0)<256){for(e=0;h>e;e++)m<<=1,v==r-1?(v=0,d.push(n(m)),m=0):v++;for(t=a.charCodeAt(0),e=0;8>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}else{for(t=1,e=0;h>e;e++)m=m<<1|t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t=0;for(t=a.charCodeAt(0),e=0;16>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}l--,0==l&&(l=Math.pow(2,h),h++),delete p[a]}else for(t=s[a],e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;l--,0==l&&(l=Math.pow(2,h),h++)}for(t=2,e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;for(;;){if(m<<=1,v==r-1){d.push(n(m));break}v++}return d.join("")},decompress:function(o){return null==o?"":""==o?null:i._decompress(o.length,32768,function(r){return o.charCodeAt(r)})},_decompress:function(o,n,e){var t,i,s,p,u,c,a,l,f=[],h=4,d=4,m=3,v="",w=[],A={val:e(0),position:n,index:1};for(i=0;3>i;i+=1)f[i]=i;for(p=0,c=Math.pow(2,2),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;switch(t=p){case 0:for(p=0,c=Math.pow(2,8),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;l=r(p);break;case 1:for(p=0,c=Math.pow(2,16),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;l=r(p);break;case 2:return""}for(f[3]=l,s=l,w.push(l);;){if(A.index>o)return"";for(p=0,c=Math.pow(2,m),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;switch(l=p){case 0:for(p=0,c=Math.pow(2,8),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;f[d++]=r(p),l=d-1,h--;break;case 1:for(p=0,c=Math.pow(2,16),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;f[d++]=r(p),l=d-1,h--;break;case 2:return w.join("")}if(0==h&&(h=Math.pow(2,m),m++),f[l])v=f[l];else{if(l!==d)return null;v=s+s.charAt(0)}w.push(v),f[d++]=s+v.charAt(0),h--,s=v,0==h&&(h=Math.pow(2,m),m++)}}};return i}();"function"==typeof define&&define.amd?define(function(){return LZString}):"undefined"!=typeof module&&null!=module&&(module.exports=LZString);"""
 
 
 # The Drawing class contains all the code required to produce an output.txt file.
 # Copy and paste contents of output.txt code (Javascript) into the web browser on the Create mode of Nifty Ink,
 # and it will draw whatever you have coded onto the Nifty Ink canvas.
 # Options exist to either overwrite existing canvas, or add a layer on top.
+#
+# Set array_backed=True to store the lines in a LineStore (contiguous NumPy columns) instead of a list of dicts.
+# This is much lighter on memory for very large drawings, and all the methods below work the same way on it.
+#
+# Colours are stored as numeric (R, G, B, A) tuples, and only turned into "rgba(...)" strings by to_nifty_object.
+# In a list-backed drawing, equal colours are interned in a palette so every line shares one tuple.
+#
+# A spatial index of the lines is built the first time query is used, and is then kept up to date as lines are added.
+#
+# Adding a drawing with + stores a snapshot of it as a Layer on top of this drawing's own lines, instead of copying its
+# lines in. Transforms, round and reversed on a drawing with layers only touch its own lines straight away, and are
+# recorded on each layer to be applied when the layers are flattened into the drawing's own lines, which happens the
+# first time all the lines are needed (writing, rendering, passes, iterating). Lines added after that go into a layer
+# of their own on top. So stacking many large layers stays cheap.
 
 class Drawing:
-    def __init__(self):
-        self.object = {"lines": [],
+    def __init__(self, array_backed=False):
+        self.object = {"lines": LineStore() if array_backed else [],
                        "width": DRAWING_SIZE,
                        "height": DRAWING_SIZE}
+        self.palette = {}
+        self._line_index = None
+        self.layers = []
+        self._shared_lines = None
+
+    # Return the shared palette entry for a colour, adding it if this is the first time it is used
+    def _intern_colour(self, colour):
+        colour = tuple(colour)
+        return self.palette.setdefault(colour, colour)
+
+    @property
+    def array_backed(self):
+        return isinstance(self.object["lines"], LineStore)
+
+    # All the lines of the drawing, flattening any layers into the drawing's own lines first
+    @property
+    def _lines(self):
+        if self.layers:
+            self._flatten()
+        return self._own_lines()
+
+    # The drawing's own lines, ready to be changed in place
+    # Lines still shared with a snapshot (see _snapshot) are copied first, so the snapshot keeps the lines it was given
+    def _own_lines(self):
+        lines = self.object["lines"]
+        if lines is self._shared_lines:
+            self.object["lines"] = lines.copy() if isinstance(lines, LineStore) else [dict(line) for line in lines]
+            self._shared_lines = None
+        return self.object["lines"]
+
+    # Copy the lines of every layer (with its pending operations applied) onto the end of this drawing's own lines
+    def _flatten(self):
+        layers, self.layers = self.layers, []
+        own_lines = self._own_lines()
+        for layer in layers:
+            drawing = layer.drawing
+            # A layer's drawing is only read here, so its lines don't need copying unless it has layers of its own
+            lines = drawing._lines if drawing.layers else drawing.object["lines"]
+            if not self.array_backed:
+                # Copy the line dicts, so later changes to this drawing leave the layer's drawing as it was
+                lines = [dict(line) for line in lines]
+            if layer.pending:
+                temp = Drawing(self.array_backed)
+                temp.palette = self.palette
+                temp.object["lines"].extend(lines)
+                for name, args in layer.pending:
+                    getattr(temp, name)(*args)
+                lines = temp.object["lines"]
+            own_lines.extend(lines)
+
+    # A copy of this drawing as it is now, for adding as a layer of another drawing
+    # The copy shares this drawing's lines, and whichever of the two changes them first copies them (see _own_lines).
+    # The layers are shared too, with their pending operations copied. A layer's drawing is never changed, except for
+    # an owned layer's drawing having lines added, so this drawing stops adding lines to its owned layer.
+    def _snapshot(self):
+        snapshot = Drawing(self.array_backed)
+        snapshot.palette = self.palette
+        snapshot.object["lines"] = self.object["lines"]
+        snapshot._shared_lines = self._shared_lines = self.object["lines"]
+        for layer in self.layers:
+            snapshot_layer = Layer(layer.drawing)
+            snapshot_layer.pending = list(layer.pending)
+            snapshot.layers.append(snapshot_layer)
+            layer.owned = False
+        return snapshot
+
+    # The drawing new lines are stored in
+    # Once this drawing has layers, new lines go into an owned layer on top, so adding lines doesn't flatten the layers
+    def _new_lines_drawing(self):
+        if not self.layers:
+            return self
+        top = self.layers[-1]
+        if not top.owned or top.pending:
+            drawing = Drawing(self.array_backed)
+            drawing.palette = self.palette
+            top = Layer(drawing, owned=True)
+            self.layers.append(top)
+        return top.drawing
+
+    # Store a single line, whichever storage engine this drawing uses
+    def _add_line(self, points, colour, brush_radius):
+        drawing = self._new_lines_drawing()
+        if self.array_backed:
+            drawing._own_lines().append(points, colour, brush_radius)
+        else:
+            drawing._own_lines().append({"points": points,
+                                         "brushColor": self._intern_colour(colour),
+                                         "brushRadius": brush_radius})
 
     # Create a round dot / point at the desired location
     def add_point(self, pos, colour, brush_radius):
-        line = {"points": [pos, pos],
-                "brushColor": "rgba({},{},{},{})".format(*colour),
-                "brushRadius": brush_radius}
-        self.object["lines"].append(line)
+        self._add_line([pos, pos], colour, brush_radius)
         return self
 
     # Use a large dot to colour the whole canvas
@@ -53,10 +173,7 @@ class Drawing:
 
     # Add a straight line between two positions on the canvas
     def add_straight_line(self, pos1, pos2, colour, brush_radius):
-        line = {"points": [pos1, pos2],
-                "brushColor": "rgba({},{},{},{})".format(*colour),
-                "brushRadius": brush_radius}
-        self.object["lines"].append(line)
+        self._add_line([pos1, pos2], colour, brush_radius)
         return self
 
     # Add a curved line between a list of points (Pos) on the canvas
@@ -67,10 +184,7 @@ class Drawing:
             points_list.append(pos)
         if enclosed_path:
             points_list.append(pos_list[0])
-        line = {"points": points_list,
-                "brushColor": "rgba({},{},{},{})".format(*colour),
-                "brushRadius": brush_radius}
-        self.object["lines"].append(line)
+        self._add_line(points_list, colour, brush_radius)
         return self
 
     # This function is only really useful for fonts. TrueTypeFonts have compressed bezier curves.
@@ -111,29 +225,158 @@ class Drawing:
             if enclosed_path:
                 points_list.append(pos_list[-1])
                 points_list.append(pos_list[0])
-            line = {"points": points_list,
-                    "brushColor": "rgba({},{},{},{})".format(*colour),
-                    "brushRadius": brush_radius}
-            self.object["lines"].append(line)
+            self._add_line(points_list, colour, brush_radius)
         return self
 
     # Add a bezier curve that is quadratic if you give 3 points, cubic if you give 4 points and so on.
-    def add_general_bezier_curve(self, control_points, colour, brush_radius, step_size=40, enclosed_path=False):
+    # Give a tolerance (in canvas pixels) to use as few points as keep the line that close to the curve,
+    # instead of a fixed step_size. Small curves, like the ones in text, then need far fewer points.
+    def add_general_bezier_curve(self, control_points, colour, brush_radius, step_size=40, enclosed_path=False,
+                                 tolerance=None):
+        tuple_control_points = [(point.x, point.y) for point in control_points]
+        if tolerance:
+            step_size = int(bezier_step_sizes(tuple_control_points, tolerance))
         if step_size < 2:
             step_size = 2
-        tuple_control_points = [(point.x, point.y) for point in control_points]
-        points = get_bezier_curve(tuple_control_points, step_size, end_point=True)
-        pos_points = [Pos(point[0], point[1]) for point in points]
+        points = get_bezier_curves(tuple_control_points, step_size, end_point=True)
+        pos_points = [Pos(x, y) for x, y in points.tolist()]
         self.add_line(pos_points, colour, brush_radius, enclosed_path=enclosed_path)
         return self
 
+    # Add many round dots in one operation, the same as calling add_point for each row
+    # xy_array is N x 2 positions, rgba_array is N x 4 colours (or a single colour for all of them)
+    # radius_array has N brush radii (or a single radius for all of them)
+    def add_points(self, xy_array, rgba_array, radius_array):
+        xy_array = np.asarray(xy_array).reshape(-1, 2)
+        offsets = np.arange(0, 2 * len(xy_array), 2)
+        self._add_lines(np.repeat(xy_array, 2, axis=0), offsets, rgba_array, radius_array)
+        return self
+
+    # Add many lines in one operation
+    # points is N x 2, all the lines one after another, and offsets gives the index in points where each line starts
+    # colours is M x 4 (or a single colour), radii has M entries (or a single radius)
+    # By default each line is curved on Nifty Ink, like add_quadratic_bezier_curve,
+    # set sharp_corners=True to get straight segments, like add_line
+    def add_lines(self, points, offsets, colours, radii, sharp_corners=False):
+        points = np.asarray(points).reshape(-1, 2)
+        offsets = complete_offsets(offsets, len(points))
+        if sharp_corners:
+            points, offsets = _duplicate_corners(points, offsets)
+        self._add_lines(points, offsets, colours, radii)
+        return self
+
+    # Store many lines at once, whichever storage engine this drawing uses
+    def _add_lines(self, points, offsets, colours, radii):
+        offsets = complete_offsets(offsets, len(points))
+        line_count = len(offsets) - 1
+        colours = np.broadcast_to(np.asarray(colours), (line_count, 4))
+        radii = np.broadcast_to(np.asarray(radii), (line_count,))
+
+        lines = self._new_lines_drawing()._own_lines()
+        if self.array_backed:
+            lines.append_many(points, offsets, colours, radii)
+            return
+
+        pos_list = [Pos(x, y) for x, y in points.tolist()]
+        offset_list = offsets.tolist()
+        for index, (colour, radius) in enumerate(zip(colours.tolist(), radii.tolist())):
+            lines.append({"points": pos_list[offset_list[index]:offset_list[index + 1]],
+                          "brushColor": self._intern_colour(colour),
+                          "brushRadius": radius})
+
+    # Each line as a tuple of (N x 2 array of points, colour, brush radius), whichever storage engine this drawing uses
+    # Starts from line number first
+    def _iter_line_arrays(self, first=0):
+        lines = self._lines
+        if isinstance(lines, LineStore):
+            colours, radii = lines.colours[first:].tolist(), lines.radii[first:].tolist()
+            for index in range(first, len(lines)):
+                yield lines.line_points(index), tuple(colours[index - first]), radii[index - first]
+        else:
+            for line in itertools.islice(lines, first, None):
+                points = np.array([(pos.x, pos.y) for pos in line["points"]], dtype=np.float64).reshape(-1, 2)
+                yield points, line["brushColor"], line["brushRadius"]
+
+    # Start point, end point and bounding box corners (widened by the brush radius) of every line, as N x 2 arrays
+    # Also returns which lines are pauses. Lines with no points have NaN for all of these. Starts from line number first
+    def _line_bounds(self, first=0):
+        lines = self._lines
+        count = len(lines) - first
+        if isinstance(lines, LineStore):
+            points, offsets, radii = lines.points, lines.offsets[first:], lines.radii[first:, None]
+            present = offsets[1:] > offsets[:-1]
+            bounds = np.full((4, count, 2), np.nan)
+            if np.any(present):
+                starts, ends = offsets[:-1][present], offsets[1:][present] - 1
+                bounds[:, present] = (points[starts], points[ends],
+                                      np.minimum.reduceat(points, starts) - radii[present],
+                                      np.maximum.reduceat(points, starts) + radii[present])
+            pauses = (lines.colours[first:, 3] == 0) & (lines.radii[first:] == 0)
+            return (*bounds, pauses)
+
+        bounds = np.full((4, count, 2), np.nan)
+        pauses = np.zeros(count, dtype=bool)
+        for index, (points, colour, brush_radius) in enumerate(self._iter_line_arrays(first)):
+            pauses[index] = _is_pause(colour, brush_radius)
+            if len(points):
+                bounds[:, index] = (points[0], points[-1],
+                                    points.min(axis=0) - brush_radius, points.max(axis=0) + brush_radius)
+        return (*bounds, pauses)
+
+    # Indices of the lines whose bounding box (widened by the brush radius) touches the rectangle (x0, y0, x1, y1),
+    # in drawing order. Useful for finding the lines in part of the canvas without looking at every line.
+    def query(self, bbox):
+        return self._updated_line_index().query(bbox)
+
+    # The spatial index of the lines, building it if needed, and adding any lines appended since it was last used
+    # It is built again from scratch if the lines have been replaced or changed in place
+    def _updated_line_index(self):
+        lines = self._lines
+        if self._line_index is None or self._line_index[0] is not lines or len(self._line_index[1]) > len(lines):
+            self._line_index = (lines, LineIndex())
+        index = self._line_index[1]
+        if len(index) < len(lines):
+            _, _, lower, upper, _ = self._line_bounds(len(index))
+            index.add(lower, upper)
+        return index
+
+    # Keep only the given lines (by index), in the order given
+    def _take_lines(self, indices):
+        lines = self._lines
+        if self.array_backed:
+            self.object["lines"] = lines.take(indices)
+        else:
+            self.object["lines"] = [lines[index] for index in indices]
+
+    # A new drawing of just the given lines (by index), sharing this drawing's palette and (in a list-backed drawing)
+    # its line dicts, so it is only for reading from
+    def _subset(self, indices):
+        subset = Drawing(self.array_backed)
+        subset.object["lines"] = self._lines
+        subset.palette = self.palette
+        subset._take_lines(indices)
+        return subset
+
+    # Replace all the lines with (N x 2 array of points, colour, brush radius) tuples, keeping the storage engine
+    def _replace_lines(self, line_arrays):
+        if self.array_backed:
+            line_arrays = list(line_arrays)
+            lines = LineStore(self.object["lines"].dtype)
+            if line_arrays:
+                points, colours, radii = zip(*line_arrays)
+                offsets = np.cumsum([0] + [len(line_points) for line_points in points])
+                lines.append_many(np.concatenate(points), offsets, colours, radii)
+        else:
+            lines = [{"points": [Pos(x, y) for x, y in compact_numbers(points).tolist()],
+                      "brushColor": self._intern_colour(colour),
+                      "brushRadius": brush_radius} for points, colour, brush_radius in line_arrays]
+        self.object["lines"] = lines
+        self.layers = []
+
     # Add a pause to the canvas, using a point off the canvas
     def add_pause(self, length):
         point = Pos(-10, -10)
-        line = {"points": [point for _ in range(length)],
-                "brushColor": "rgba(0, 0, 0, 0)",
-                "brushRadius": 0}
-        self.object["lines"].append(line)
+        self._add_line([point for _ in range(length)], (0, 0, 0, 0), 0)
         return self
 
     # Add a square to the canvas
@@ -236,18 +479,278 @@ class Drawing:
     # Randomly reorder the lines
     # Nifty Ink will animate in an interesting random order
     def shuffle_lines(self):
-        random.shuffle(self.object["lines"])
+        if self.array_backed:
+            # Shuffle an index list so the random seed still reproduces the same order
+            order = list(range(len(self)))
+            random.shuffle(order)
+            self.object["lines"] = self._lines.take(order)
+        else:
+            random.shuffle(self._lines)
+            self._line_index = None
         return self
 
+    # Reorder the lines to cut down how far the pen travels between them as Nifty Ink plays the drawing back.
+    # Lines that may overlap are never reordered, so the finished drawing looks the same.
+    # method="nearest" always draws the closest line that can go next, and brings lines that end where another
+    # starts next to each other, ready for merge_lines. method="sweep" follows a space filling curve instead,
+    # which travels further but is several times faster for drawings with millions of lines.
+    # Pauses stay in place, only the lines between them are reordered.
+    # Returns a report of the total pen travel before and after.
+    def optimise_order(self, method="nearest"):
+        starts, ends, lower, upper, pauses = self._line_bounds()
+        barriers = np.flatnonzero(pauses | np.isnan(starts[:, 0])).tolist()
+
+        report = {"travel_before": 0.0, "travel_after": 0.0}
+        order = []
+        segment_start = 0
+        for barrier in barriers + [len(self)]:
+            indices = np.arange(segment_start, barrier)
+            segment_order = stroke_order(starts[indices], ends[indices], lower[indices], upper[indices],
+                                         DRAWING_SIZE, method)
+            report["travel_before"] += travel_distance(starts[indices], ends[indices], range(len(indices)))
+            report["travel_after"] += travel_distance(starts[indices], ends[indices], segment_order)
+            order.extend(indices[segment_order].tolist())
+            if barrier < len(self):
+                order.append(barrier)
+            segment_start = barrier + 1
+
+        self._take_lines(order)
+        return report
+
+    # Remove points that make no visible difference, such as the many nearly collinear points of bezier curves,
+    # fractal fills and font outlines, using Ramer-Douglas-Peucker simplification on each line.
+    # tolerance is the largest distance (in canvas units) a line may move, thicker lines can be allowed to move more
+    # with brush_fraction, e.g. 0.1 allows up to a tenth of the brush radius.
+    # Repeated points (sharp corners from add_line, and pauses) are kept repeated.
+    # Returns a report of the points removed and bytes saved in the JSON output.
+    def simplify(self, tolerance=0.5, brush_fraction=0.0):
+        report = {"points_removed": 0, "bytes_saved": 0}
+
+        def simplified_lines():
+            for points, colour, brush_radius in self._iter_line_arrays():
+                simplified = simplify_line(points, max(tolerance, brush_fraction * brush_radius))
+                if len(simplified) < len(points):
+                    report["points_removed"] += len(points) - len(simplified)
+                    report["bytes_saved"] += points_json_size(points) - points_json_size(simplified)
+                yield simplified, colour, brush_radius
+
+        self._replace_lines(simplified_lines())
+        return report
+
+    # Remove lines that cannot be seen, because later fully opaque lines completely cover them.
+    # The canvas is split into a resolution x resolution grid, and lines are walked from last (top) to first.
+    # A line is dropped if every cell it could touch is already fully covered, and an opaque line marks the cells
+    # it fully covers. Only lines with alpha 1 cover anything, translucent lines can be hidden but never hide others.
+    # Pauses, and lines entirely off the canvas, are always kept.
+    # Returns a report of the lines removed and bytes saved in the JSON output.
+    def cull_hidden_lines(self, resolution=250):
+        cell_size = DRAWING_SIZE / resolution
+        half_diagonal = cell_size * math.sqrt(2) / 2
+        cell_centres = (np.arange(resolution) + 0.5) * cell_size
+
+        lines = self._lines
+        if not isinstance(lines, LineStore):
+            lines = LineStore()
+            lines.extend(self._lines)
+        line_count = len(lines)
+        # Work from the top line down, so line number n below is line line_count - 1 - n of the drawing
+        lines = lines.take(np.arange(line_count - 1, -1, -1))
+        colours, radii = lines.colours, lines.radii
+        curve_points, curve_offsets, curve_errors = nifty_curves(lines.points.astype(np.float64), lines.offsets)
+
+        # Pauses have no reach, so they touch no cells and are always kept
+        pauses = (colours[:, 3] == 0) & (radii == 0)
+        reach = np.where(pauses, -np.inf, radii + curve_errors + half_diagonal)
+        cover_radii = np.where(colours[:, 3] >= 1, radii - curve_errors - half_diagonal, -np.inf)
+
+        # Rather than walking down the lines one by one, each cell records the first line that fully covers it, and a
+        # line is hidden if every cell it could touch is covered by a line before it. Whether a line is kept makes no
+        # difference to what is covered, as the cells a hidden line covers were all covered already.
+        # Chunks of lines arrive in order, so every line before those in a chunk has already marked what it covers.
+        covered_by = np.full(resolution * resolution, line_count)
+        touches = np.zeros(line_count, dtype=bool)
+        last_covered = np.full(line_count, -1)
+        for line_numbers, cells, distances in polylines_grid_distances(curve_points, curve_offsets, reach,
+                                                                        cell_centres):
+            covering = distances <= cover_radii[line_numbers]
+            np.minimum.at(covered_by, cells[covering], line_numbers[covering])
+            touches[line_numbers] = True
+            np.maximum.at(last_covered, line_numbers, covered_by[cells])
+        hidden = touches & (last_covered < np.arange(line_count))
+
+        # Lines just off the canvas can have cells around them without being close enough to touch any,
+        # those are hidden if all of the cells around them are covered
+        present = (np.diff(curve_offsets) > 0) & ~pauses & ~touches
+        # Each line's points from its start to its end, with a spare point so the last end is a valid index
+        bounds = np.stack((curve_offsets[:-1][present], curve_offsets[1:][present]), axis=1).ravel()
+        padded_points = np.concatenate((curve_points, np.zeros((1, 2))))
+        low = np.searchsorted(cell_centres, np.minimum.reduceat(padded_points, bounds)[::2] - reach[present, None])
+        high = np.searchsorted(cell_centres, np.maximum.reduceat(padded_points, bounds)[::2] + reach[present, None],
+                               side="right")
+        covered_by = covered_by.reshape(resolution, resolution)
+        for index, (x0, y0), (x1, y1) in zip(np.flatnonzero(present).tolist(), low.tolist(), high.tolist()):
+            if x0 < x1 and y0 < y1:
+                hidden[index] = np.all(covered_by[y0:y1, x0:x1] < index)
+
+        report = {"lines_removed": int(hidden.sum()), "bytes_saved": 0}
+        kept = line_count - 1 - np.flatnonzero(~hidden)[::-1]
+        removed = line_count - 1 - np.flatnonzero(hidden)[::-1]
+        report["bytes_saved"] = lines_json_size(self._subset(removed)._iter_line_arrays())
+        self._replace_lines(list(self._subset(kept)._iter_line_arrays()))
+        return report
+
+    # Remove lines, and parts of lines, that are off the canvas and can't be seen, such as from scaling a drawing up,
+    # fractals that spread past the edge or rotated images. Lines partly on the canvas are cut down to the parts that
+    # can be seen, splitting them into several lines where that is smaller. Translucent lines are only trimmed at
+    # their ends and never split, as the pieces could blend over each other where the whole line did not.
+    # Pauses are always kept, even though they are off the canvas.
+    # Returns a report of the lines removed (entirely off the canvas), lines split into several pieces, the extra lines
+    # added by those splits, points removed and bytes saved in the JSON output.
+    def clip_to_canvas(self):
+        _, _, lower, upper, pauses = self._line_bounds()
+        # Lines that are either wholly on or wholly off the canvas can be dealt with without looking at their points
+        inside = np.all((lower >= 0) & (upper <= DRAWING_SIZE), axis=1)
+        outside = np.any((lower > DRAWING_SIZE) | (upper < 0), axis=1)
+        keep_whole = (inside | pauses | np.isnan(lower[:, 0])).tolist()
+        outside = (outside & ~pauses).tolist()
+
+        report = {"lines_removed": 0, "lines_split": 0, "lines_added": 0, "points_removed": 0, "bytes_saved": 0}
+
+        def clipped_lines():
+            for index, (points, colour, brush_radius) in enumerate(self._iter_line_arrays()):
+                if keep_whole[index]:
+                    yield points, colour, brush_radius
+                    continue
+                pieces = [] if outside[index] else clip_line(points, brush_radius, DRAWING_SIZE,
+                                                             split=not 0 < colour[3] < 1)
+                if len(pieces) == 1 and len(pieces[0]) == len(points):
+                    yield points, colour, brush_radius
+                    continue
+                if not pieces:
+                    report["lines_removed"] += 1
+                elif len(pieces) > 1:
+                    report["lines_split"] += 1
+                    report["lines_added"] += len(pieces) - 1
+                report["points_removed"] += len(points) - sum(map(len, pieces))
+                report["bytes_saved"] += (line_json_size(points, colour, brush_radius) -
+                                          sum(line_json_size(piece, colour, brush_radius) for piece in pieces))
+                for piece in pieces:
+                    yield piece, colour, brush_radius
+
+        self._replace_lines(clipped_lines())
+        return report
+
+    # Join runs of consecutive lines with the same colour and brush radius into single lines, so the colour and
+    # radius are only written once, which makes a big difference to dot heavy drawings such as point images.
+    # Nifty Ink draws each line as one continuous stroke, so lines are only joined where that looks the same:
+    # where one line ends on the point the next starts from, or where the hop between them is off the canvas.
+    # max_gap also allows joining across gaps up to that size, which does draw a short stroke between the lines.
+    # Translucent lines are never joined, as a single stroke does not blend over itself like separate lines do.
+    # Returns a report of the lines removed and bytes saved in the JSON output.
+    def merge_lines(self, max_gap=0.0):
+        report = {"lines_removed": 0, "bytes_saved": 0}
+
+        def can_join(previous, points, colour, brush_radius):
+            if len(previous) == 0 or len(points) == 0 or 0 < colour[3] < 1:
+                return False
+            if colour[3] == 0 or np.all(previous[-1] == points[0]):
+                return True
+            if segment_off_canvas(previous[-1], points[0], DRAWING_SIZE, brush_radius):
+                return True
+            return bool(np.hypot(*(points[0] - previous[-1])) <= max_gap)
+
+        def joined(group, colour, brush_radius):
+            points = join_lines(group)
+            if len(group) > 1:
+                # Each line removed saves its colour, radius and brackets, but the joins may add a few points
+                line_size = line_json_size(np.zeros((0, 2)), colour, brush_radius) - 1
+                report["lines_removed"] += len(group) - 1
+                report["bytes_saved"] += ((len(group) - 1) * line_size + sum(map(points_json_size, group)) -
+                                          points_json_size(points))
+            return points, colour, brush_radius
+
+        def merged_lines():
+            group, style = [], None
+            for points, colour, brush_radius in self._iter_line_arrays():
+                if group and style == (colour, brush_radius) and can_join(group[-1], points, colour, brush_radius):
+                    group.append(points)
+                    continue
+                if group:
+                    yield joined(group, *style)
+                group, style = [points], (colour, brush_radius)
+            if group:
+                yield joined(group, *style)
+
+        self._replace_lines(merged_lines())
+        return report
+
+    # Shrink the drawing until the estimated size of to_nifty_import's output is at most max_bytes,
+    # useful when large drawings hit browser local storage limits.
+    # Reductions are tried in order, each a little harsher than the last, stopping as soon as the drawing fits:
+    # rounding point coordinates to fewer decimal places, rounding colours, simplifying lines with a growing
+    # tolerance, and finally dropping the smallest lines (pauses are never dropped).
+    # Lossless passes such as clip_to_canvas, cull_hidden_lines and merge_lines are worth trying first.
+    # Returns a report of the estimated sizes and each reduction used.
+    def fit_to_budget(self, max_bytes, compressed=False):
+        estimate = self.estimate_size(compressed)
+        report = {"estimated_size_before": estimate, "steps": []}
+
+        def round_coordinates(decimals):
+            self._line_index = None
+            if self.array_backed:
+                lines = self._lines
+                lines.points[:] = np.round(lines.points, decimals)
+            else:
+                for line in self:
+                    line["points"] = [round(pos, decimals or None) for pos in line["points"]]
+
+        def round_colours(_):
+            if self.array_backed:
+                colours = self._lines.colours
+                colours[:, :3], colours[:, 3] = np.round(colours[:, :3]), np.round(colours[:, 3], 2)
+            else:
+                for line in self:
+                    r, g, b, a = line["brushColor"]
+                    line["brushColor"] = self._intern_colour((round(r), round(g), round(b), round(a, 2)))
+
+        def drop_small_lines(size):
+            _, _, lower, upper, pauses = self._line_bounds()
+            extents = np.max(upper - lower, axis=1)
+            self._take_lines(np.flatnonzero(~(extents < size) | pauses))
+
+        reductions = ([(round_coordinates, "round_coordinates", decimals) for decimals in (2, 1, 0)] +
+                      [(round_colours, "round_colours", None)] +
+                      [(self.simplify, "simplify", tolerance) for tolerance in (0.5, 1, 2, 4)] +
+                      [(drop_small_lines, "drop_small_lines", size) for size in (1, 2, 4, 8, 16, 32)])
+        for reduction, name, value in reductions:
+            if estimate <= max_bytes:
+                break
+            line_count = len(self)
+            reduction(value)
+            estimate = self.estimate_size(compressed)
+            report["steps"].append({"step": name, "value": value, "lines_removed": line_count - len(self),
+                                    "estimated_size": estimate})
+
+        report["estimated_size_after"] = estimate
+        report["within_budget"] = estimate <= max_bytes
+        return report
+
     # Use this to make your drawings slightly less precise, but also reduce their size a lot
     # This can be useful if browser local storage limits start affecting your large drawings
     def __round__(self, n_digits=None):
-        for line in self:
-            r, g, b, a = [float(x) for x in line['brushColor'][5:-1].split(",")]
-            if a == 1:
-                line['brushColor'] = "rgb(" + ",".join([str(round(r)), str(round(g)), str(round(b))]) + ")"
-            else:
-                line['brushColor'] = "rgba(" + ",".join([str(round(r)), str(round(g)), str(round(b)), str(a)]) + ")"
+        self._line_index = None
+        for layer in self.layers:
+            layer.pending.append(("__round__", (n_digits,)))
+        if self.array_backed:
+            lines = self._own_lines()
+            lines.points[:] = np.round(lines.points, n_digits or 0)
+            lines.colours[:, :3] = np.round(lines.colours[:, :3])
+            lines.radii[:] = np.round(lines.radii)
+            return self
+
+        for line in self._own_lines():
+            r, g, b, a = line['brushColor']
+            line['brushColor'] = self._intern_colour((round(r), round(g), round(b), a))
 
             line['brushRadius'] = round(line['brushRadius'])
             line['points'] = [round(point, n_digits) for point in line['points']]
@@ -255,70 +758,199 @@ class Drawing:
 
     # Reverse the drawing order of all the lines, this will mess up the final appearance if lines overlap!
     def __reversed__(self):
-        self.object['lines'] = list(reversed(self.object['lines']))
+        if self.layers:
+            # The drawing's own lines become the bottom layer, then every layer is reversed, from the top down
+            own_lines = Drawing(self.array_backed)
+            own_lines.palette = self.palette
+            own_lines.object["lines"] = self.object["lines"]
+            own_lines._shared_lines = self._shared_lines
+            self.object["lines"] = LineStore(own_lines.object["lines"].dtype) if self.array_backed else []
+            self.layers = [Layer(own_lines)] + self.layers
+            for layer in self.layers:
+                layer.pending.append(("__reversed__", ()))
+            self.layers.reverse()
+            return self
+
+        if self.array_backed:
+            self.object['lines'] = self.object['lines'].take(range(len(self) - 1, -1, -1))
+        else:
+            self.object['lines'] = list(reversed(self.object['lines']))
         return self
 
-    # Shrink or expand all the stored lines using multiplication
-    def __mul__(self, shrink_size):
-        # origin for shrinking
-        origin = Pos(DRAWING_SIZE / 2, DRAWING_SIZE / 2)
-
-        # shrink each point
-        for line in self:
-            for point_index in range(len(line["points"])):
-                point_pos = line["points"][point_index]
-                point_pos -= origin
-                point_pos *= shrink_size
-                point_pos += origin
-                line["points"][point_index] = point_pos
+    # Apply an affine transformation to every point in the drawing in one vectorised pass
+    # matrix is either a 2 x 2 matrix, used together with offset, or a 2 x 3 affine matrix [[a, b, tx], [c, d, ty]]
+    # Each point p becomes matrix @ p + offset
+    # Set scale_brush=True to also scale the brush radii by the area scale factor of the matrix
+    def transform(self, matrix, offset=(0, 0), scale_brush=False):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+        if matrix.shape == (2, 3):
+            matrix, offset = matrix[:, :2], matrix[:, 2] + offset
+        brush_scale = math.sqrt(abs(np.linalg.det(matrix)))
+        self._line_index = None
+        for layer in self.layers:
+            layer.pending.append(("transform", (matrix, offset, scale_brush)))
+
+        if self.array_backed:
+            lines = self._own_lines()
+            lines.points[:] = lines.points @ matrix.T + offset
+            if scale_brush:
+                lines.radii[:] *= brush_scale
+            return self
+
+        # Transform all the points together, then give every line new Pos objects.
+        # New objects are needed, as lines from add_line and add_point share one Pos between repeated points.
+        lines = self._own_lines()
+        points = np.array([(pos.x, pos.y) for line in lines for pos in line["points"]], dtype=np.float64)
+        points = (points.reshape(-1, 2) @ matrix.T + offset).tolist()
+        index = 0
+        for line in lines:
+            point_count = len(line["points"])
+            line["points"] = [Pos(x, y) for x, y in points[index:index + point_count]]
+            index += point_count
+            if scale_brush:
+                line["brushRadius"] *= brush_scale
         return self
 
+    # Scale the drawing about an origin, default is the centre of the canvas
+    def scale(self, factor, origin=None, scale_brush=False):
+        if origin is None:
+            origin = Pos(DRAWING_SIZE / 2, DRAWING_SIZE / 2)
+        offset = (origin.x * (1 - factor), origin.y * (1 - factor))
+        return self.transform(np.identity(2) * factor, offset, scale_brush=scale_brush)
+
+    # Rotate the drawing (in radians) about an origin, default is the centre of the canvas
+    # Same direction of rotation as Pos.rotate and helper_fns.rotate
+    def rotate(self, rotation, origin=None):
+        if origin is None:
+            origin = Pos(DRAWING_SIZE / 2, DRAWING_SIZE / 2)
+        c, s = math.cos(rotation), math.sin(rotation)
+        matrix = np.array(((c, -s), (s, c)))
+        offset = np.array((origin.x, origin.y)) - matrix @ (origin.x, origin.y)
+        return self.transform(matrix, offset)
+
+    # Move the whole drawing by an offset Pos
+    def translate(self, offset):
+        return self.transform(np.identity(2), (offset.x, offset.y))
+
+    # Shrink or expand all the stored lines using multiplication, about the centre of the canvas
+    def __mul__(self, shrink_size):
+        return self.scale(shrink_size)
+
     # Adds a specified drawing as a new layer on top of this drawing
+    # The layer is a snapshot of the added drawing, so changes made to the added drawing afterwards don't show up here
     # TODO: Handle canvas size scaling (which we currently don't change anyway)
     def __add__(self, drawing):
-        self.object['lines'].extend(drawing.object['lines'])
+        self.layers.append(Layer(drawing._snapshot()))
         return self
 
     def __iter__(self):
-        for line in self.object['lines']:
+        for line in self._lines:
             yield line
 
     def __len__(self):
-        return len(self.object['lines'])
+        return len(self.object['lines']) + sum(len(layer.drawing) for layer in self.layers)
+
+    # Total number of points in all the lines
+    def point_count(self):
+        lines = self.object["lines"]
+        if isinstance(lines, LineStore):
+            own_count = lines.point_count()
+        else:
+            own_count = sum(len(line["points"]) for line in lines)
+        return own_count + sum(layer.drawing.point_count() for layer in self.layers)
 
     # Save raw drawing data to a file for later use.
-    def export_raw_data(self, file_name, indent=4):
+    # With no indent, the data is streamed to the file line by line, so it needs very little extra memory
+    # Set binary=True to use the compact binary format instead of JSON, with points stored at the given precision
+    # (np.float32 halves the size of the point data)
+    def export_raw_data(self, file_name, indent=None, binary=False, precision=np.float64):
+        if binary:
+            lines = self._lines
+            if not self.array_backed:
+                lines = LineStore()
+                lines.extend(self._lines)
+            write_ink_file(lines, file_name, precision)
+            return self
+
         with open(file_name, "w") as file:
-            json.dump(self.to_nifty_object(), file, indent=indent)
+            if indent is None:
+                write_nifty_json(self, file)
+            else:
+                json.dump(self.to_nifty_object(), file, indent=indent)
         return self
 
     # Load a raw data file and replace the contents of this drawing.
-    def import_raw_data(self, file_name):
+    # Binary files are loaded into a LineStore (so the drawing becomes array backed), and by default are
+    # memory-mapped, so loading is near-instant and lines are only read from disk when they are used
+    def import_raw_data(self, file_name, memory_map=True):
+        if is_ink_file(file_name):
+            self.object = {"lines": read_ink_file(file_name, memory_map=memory_map),
+                           "width": DRAWING_SIZE,
+                           "height": DRAWING_SIZE}
+            self.layers = []
+            return self
+
+        array_backed = self.array_backed
         with open(file_name, "r") as file:
             self.object = self.from_nifty_object(json.load(file))
+        self.layers = []
+        if array_backed:
+            lines = LineStore()
+            lines.extend(self.object["lines"])
+            self.object["lines"] = lines
         return self
 
     def to_nifty_object(self):
-        temp = []
-        for line in self:
-            temp.append({
-                "points": [pos.point() for pos in line['points']],
-                "brushColor": line['brushColor'],
-                "brushRadius": line['brushRadius']
-            })
         return {
-            "lines": temp,
+            "lines": list(self.iter_nifty_lines()),
             "width": DRAWING_SIZE,
             "height": DRAWING_SIZE
         }
 
+    # Generate each line in the form Nifty Ink expects, one at a time
+    # Colours become strings here, each distinct colour is only formatted once
+    def iter_nifty_lines(self):
+        colour_strings = {}
+
+        def colour_string(colour):
+            if colour not in colour_strings:
+                colour_strings[colour] = colour_to_string(colour)
+            return colour_strings[colour]
+
+        if not self.array_backed:
+            for line in self:
+                yield {
+                    "points": [pos.point() for pos in line['points']],
+                    "brushColor": colour_string(line['brushColor']),
+                    "brushRadius": line['brushRadius']
+                }
+            return
+
+        # Convert the LineStore columns to Python values a block of lines at a time
+        lines = self._lines
+        for block_start in range(0, len(lines), NIFTY_LINE_BLOCK_SIZE):
+            block_end = min(block_start + NIFTY_LINE_BLOCK_SIZE, len(lines))
+            offsets = lines.offsets[block_start:block_end + 1]
+            points = compact_numbers(lines.points[offsets[0]:offsets[-1]]).tolist()
+            offsets = (offsets - offsets[0]).tolist()
+            colours = lines.colours[block_start:block_end].tolist()
+            radii = compact_numbers(lines.radii[block_start:block_end]).tolist()
+
+            for index in range(block_end - block_start):
+                yield {
+                    "points": [{"x": x, "y": y} for x, y in points[offsets[index]:offsets[index + 1]]],
+                    "brushColor": colour_string(tuple(colours[index])),
+                    "brushRadius": radii[index]
+                }
+
     @staticmethod
     def from_nifty_object(json_dict):
         temp = []
         for line in json_dict['lines']:
             temp.append({
                 "points": [Pos(point["x"], point["y"]) for point in line['points']],
-                "brushColor": line['brushColor'],
+                "brushColor": string_to_colour(line['brushColor']),
                 "brushRadius": line['brushRadius']
             })
         return {
@@ -327,38 +959,145 @@ class Drawing:
             "height": json_dict["height"]
         }
 
+    # Estimate the size in bytes of to_nifty_import's output (or to_nifty_add_layer_import's, with add_layer=True)
+    # without building it, which is far quicker for big drawings.
+    # Small drawings are measured exactly. For large ones an evenly spaced sample of lines is encoded and the size
+    # scaled up by the number of lines and points. When compressed, the sample is compressed to find how well
+    # the drawing compresses.
+    def estimate_size(self, compressed=False, add_layer=False, sample_lines=2048):
+        def export_size(drawing):
+            export = drawing.to_nifty_add_layer_import if add_layer else drawing.to_nifty_import
+            return len(export(compressed).encode("utf-8"))
+
+        if len(self) <= sample_lines:
+            return export_size(self)
+
+        sample = self._subset(np.linspace(0, len(self) - 1, sample_lines).astype(np.int64))
+        scale = (self.point_count() + len(self)) / (sample.point_count() + len(sample))
+        lines_size = nifty_lines_size(sample.iter_nifty_lines(), escape_quotes=not compressed) * scale
+
+        empty = self._subset([])
+        empty_size = export_size(empty)
+        if not compressed:
+            return empty_size + round(lines_size)
+
+        def compressed_size(drawing):
+            json_data = _write_to_string(lambda output: write_nifty_json(drawing, output))
+            if add_layer:
+                return len(json_data), len(lz_string.compress_to_base64(json_data))
+            return len(json_data), len(to_js_string_literal(lz_string.compress(json_data)).encode("utf-8"))
+
+        empty_json_size, empty_compressed_size = compressed_size(empty)
+        sample_json_size, sample_compressed_size = compressed_size(sample)
+        ratio = sample_compressed_size / sample_json_size
+        return empty_size - empty_compressed_size + round((empty_json_size + lines_size) * ratio)
+
+    # Write the drawing as several numbered files, for drawings too big to import in one go.
+    # Each file is at most max_bytes. The first replaces the canvas and the rest each add a layer on top,
+    # so paste them into the console in order. file_name is formatted with the part number, starting at 1.
+    # Returns the names of the files written.
+    def write_nifty_import_parts(self, max_bytes, file_name="output_{:03d}.txt", compressed=True):
+        if self.array_backed:
+            line_sizes = np.diff(self._lines.offsets) + 1
+        else:
+            line_sizes = np.array([len(line["points"]) + 1 for line in self], dtype=np.int64)
+        cumulative_sizes = np.concatenate(([0], np.cumsum(line_sizes)))
+
+        # Work out how many bytes each point (or line) costs in each kind of import, and the fixed cost of each file
+        part_capacities = []
+        for add_layer in (False, True):
+            empty_size = self._subset([]).estimate_size(compressed, add_layer)
+            unit_size = (self.estimate_size(compressed, add_layer) - empty_size) / max(cumulative_sizes[-1], 1)
+            if empty_size >= max_bytes:
+                raise ValueError(f"max_bytes must be more than {empty_size}, the size of an empty import")
+            part_capacities.append((max_bytes - empty_size) / unit_size if unit_size else math.inf)
+
+        # Cut the lines into parts, guessing how many lines fit from the average cost, then checking the real size
+        # of the part and cutting it down in proportion to how far over it is, until it fits
+        file_names = []
+        start = 0
+        while start < len(self) or not file_names:
+            capacity = part_capacities[bool(file_names)]
+            end = int(np.searchsorted(cumulative_sizes, cumulative_sizes[start] + capacity, side="right")) - 1
+            end = min(max(end, start + 1), len(self))
+            while True:
+                part_drawing = self._subset(range(start, end))
+                if file_names:
+                    text = part_drawing.to_nifty_add_layer_import(compressed)
+                else:
+                    text = part_drawing.to_nifty_import(compressed)
+                size = len(text.encode("utf-8"))
+                if size <= max_bytes:
+                    break
+                if end == start + 1:
+                    raise ValueError(f"Line {start} does not fit in max_bytes on its own, its import is {size} bytes")
+                end = start + max(min(int((end - start) * max_bytes / size * 0.95), end - start - 1), 1)
+
+            file_names.append(file_name.format(len(file_names) + 1))
+            with open(file_names[-1], "w", encoding="utf-8") as file:
+                file.write(text)
+            start = end
+        return file_names
+
     # Nifty import method 1 - deprecated
     def to_nifty_show_import(self):
-        return "drawingCanvas.current.loadSaveData(\"" + json.dumps(self.to_nifty_object()).replace('"', '\\"') + "\", false)"
+        return _write_to_string(self.write_nifty_show_import)
+
+    def write_nifty_show_import(self, file):
+        file.write("drawingCanvas.current.loadSaveData(\"")
+        write_nifty_json(self, file, escape_quotes=True)
+        file.write("\", false)")
+        return self
 
     # Nifty import method 2 - overwrite canvas
-    def to_nifty_import(self):
-        # Use a minified LZString
-        # https://raw.githubusercontent.com/pieroxy/lz-string/master/libs/lz-string.min.js
-        lz_string = """var LZString=function(){function o(o,r){if(!t[o]){t[o]={};for(var n=0;n<o.length;n++)t[o][o.charAt(n)]=n}return t[o][r]}var r=String.fromCharCode,n="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=",e="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+-$",t={},i={compressToBase64:function(o){if(null==o)return"";var r=i._compress(o,6,function(o){return n.charAt(o)});switch(r.length%4){default:case 0:return r;case 1:return r+"===";case 2:return r+"==";case 3:return r+"="}},decompressFromBase64:function(r){return null==r?"":""==r?null:i._decompress(r.length,32,function(e){return o(n,r.charAt(e))})},compressToUTF16:function(o){return null==o?"":i._compress(o,15,function(o){return r(o+32)})+" "},decompressFromUTF16:function(o){return null==o?"":""==o?null:i._decompress(o.length,16384,function(r){return o.charCodeAt(r)-32})},compressToUint8Array:function(o){for(var r=i.compress(o),n=new Uint8Array(2*r.length),e=0,t=r.length;t>e;e++){var s=r.charCodeAt(e);n[2*e]=s>>>8,n[2*e+1]=s%256}return n},decompressFromUint8Array:function(o){if(null===o||void 0===o)return i.decompress(o);for(var n=new Array(o.length/2),e=0,t=n.length;t>e;e++)n[e]=256*o[2*e]+o[2*e+1];var s=[];return n.forEach(function(o){s.push(r(o))}),i.decompress(s.join(""))},compressToEncodedURIComponent:function(o){return null==o?"":i._compress(o,6,function(o){return e.charAt(o)})},decompressFromEncodedURIComponent:function(r){return null==r?"":""==r?null:(r=r.replace(/ /g,"+"),i._decompress(r.length,32,function(n){return o(e,r.charAt(n))}))},compress:function(o){return i._compress(o,16,function(o){return r(o)})},_compress:function(o,r,n){if(null==o)return"";var e,t,i,s={},p={},u="",c="",a="",l=2,f=3,h=2,d=[],m=0,v=0;for(i=0;i<o.length;i+=1)if(u=o.charAt(i),Object.prototype.hasOwnProperty.call(s,u)||(s[u]=f++,p[u]=!0),c=a+u,Object.prototype.hasOwnProperty.call(s,c))a=c;else{if(Object.prototype.hasOwnProperty.call(p,a)){if(a.charCodeAt(0)<256){for(e=0;h>e;e++)m<<=1,v==r-1?(v=0,d.push(n(m)),m=0):v++;for(t=a.charCodeAt(0),e=0;8>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}else{for(t=1,e=0;h>e;e++)m=m<<1|t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t=0;for(t=a.charCodeAt(0),e=0;16>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}l--,0==l&&(l=Math.pow(2,h),h++),delete p[a]}else for(t=s[a],e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;l--,0==l&&(l=Math.pow(2,h),h++),s[c]=f++,a=String(u)}if(""!==a){if(Object.prototype.hasOwnProperty.call(p,a)){if(a.charCodeAt(0)<256){for(e=0;h>e;e++)m<<=1,v==r-1?(v=0,d.push(n(m)),m=0):v++;for(t=a.charCodeAt(0),e=0;8>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}else{for(t=1,e=0;h>e;e++)m=m<<1|t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t=0;for(t=a.charCodeAt(0),e=0;16>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}l--,0==l&&(l=Math.pow(2,h),h++),delete p[a]}else for(t=s[a],e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;l--,0==l&&(l=Math.pow(2,h),h++)}for(t=2,e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;for(;;){if(m<<=1,v==r-1){d.push(n(m));break}v++}return d.join("")},decompress:function(o){return null==o?"":""==o?null:i._decompress(o.length,32768,function(r){return o.charCodeAt(r)})},_decompress:function(o,n,e){var t,i,s,p,u,c,a,l,f=[],h=4,d=4,m=3,v="",w=[],A={val:e(0),position:n,index:1};for(i=0;3>i;i+=1)f[i]=i;for(p=0,c=Math.pow(2,2),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;switch(t=p){case 0:for(p=0,c=Math.pow(2,8),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;l=r(p);break;case 1:for(p=0,c=Math.pow(2,16),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;l=r(p);break;case 2:return""}for(f[3]=l,s=l,w.push(l);;){if(A.index>o)return"";for(p=0,c=Math.pow(2,m),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;switch(l=p){case 0:for(p=0,c=Math.pow(2,8),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;f[d++]=r(p),l=d-1,h--;break;case 1:for(p=0,c=Math.pow(2,16),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;f[d++]=r(p),l=d-1,h--;break;case 2:return w.join("")}if(0==h&&(h=Math.pow(2,m),m++),f[l])v=f[l];else{if(l!==d)return null;v=s+s.charAt(0)}w.push(v),f[d++]=s+v.charAt(0),h--,s=v,0==h&&(h=Math.pow(2,m),m++)}}};return i}();"function"==typeof define&&define.amd?define(function(){return LZString}):"undefined"!=typeof module&&null!=module&&(module.exports=LZString);"""
+    # Set compressed=True to compress the drawing here in Python, and write the compressed string straight into
+    # localStorage. The console paste is much smaller and the browser has no compressing to do.
+    # The compressed output contains non-ASCII characters, so write it to a UTF-8 file.
+    def to_nifty_import(self, compressed=False):
+        return _write_to_string(self.write_nifty_import, compressed=compressed)
+
+    # Write the import straight to a file (or file-like object), the drawing data is streamed line by line
+    def write_nifty_import(self, file, compressed=False):
+        if compressed:
+            json_data = _write_to_string(lambda output: write_nifty_json(self, output))
+            file.write("window.localStorage.setItem(\"drawing\", JSON.stringify(" +
+                       to_js_string_literal(lz_string.compress(json_data)) + "));")
+            file.write("location.reload();")
+            return self
+
+        file.write(LZ_STRING)
 
         # Set up the json string
-        json_string = "var json_string = \"" + json.dumps(self.to_nifty_object()).replace("\"", "\\\"").replace(" ", "") + "\";"
+        file.write("var json_string = \"")
+        write_nifty_json(self, file, escape_quotes=True)
+        file.write("\";")
 
         # Update the session storage with the escaped unicode point compressed json string
-        local_storage = """window.localStorage.setItem("drawing", JSON.stringify(LZString.compress(json_string)));"""
+        file.write("""window.localStorage.setItem("drawing", JSON.stringify(LZString.compress(json_string)));""")
 
         # Refresh the Create Ink page to show the new Canvas Ink
-        refresh_page = "location.reload();"
-
-        return lz_string + json_string + local_storage + refresh_page
+        file.write("location.reload();")
+        return self
 
     # Nifty import method 3 - add layer on top of canvas
-    def to_nifty_add_layer_import(self):
-        # Use a minified LZString
-        # https://raw.githubusercontent.com/pieroxy/lz-string/master/libs/lz-string.min.js
-        lz_string = """var LZString=function(){function o(o,r){if(!t[o]){t[o]={};for(var n=0;n<o.length;n++)t[o][o.charAt(n)]=n}return t[o][r]}var r=String.fromCharCode,n="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=",e="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+-$",t={},i={compressToBase64:function(o){if(null==o)return"";var r=i._compress(o,6,function(o){return n.charAt(o)});switch(r.length%4){default:case 0:return r;case 1:return r+"===";case 2:return r+"==";case 3:return r+"="}},decompressFromBase64:function(r){return null==r?"":""==r?null:i._decompress(r.length,32,function(e){return o(n,r.charAt(e))})},compressToUTF16:function(o){return null==o?"":i._compress(o,15,function(o){return r(o+32)})+" "},decompressFromUTF16:function(o){return null==o?"":""==o?null:i._decompress(o.length,16384,function(r){return o.charCodeAt(r)-32})},compressToUint8Array:function(o){for(var r=i.compress(o),n=new Uint8Array(2*r.length),e=0,t=r.length;t>e;e++){var s=r.charCodeAt(e);n[2*e]=s>>>8,n[2*e+1]=s%256}return n},decompressFromUint8Array:function(o){if(null===o||void 0===o)return i.decompress(o);for(var n=new Array(o.length/2),e=0,t=n.length;t>e;e++)n[e]=256*o[2*e]+o[2*e+1];var s=[];return n.forEach(function(o){s.push(r(o))}),i.decompress(s.join(""))},compressToEncodedURIComponent:function(o){return null==o?"":i._compress(o,6,function(o){return e.charAt(o)})},decompressFromEncodedURIComponent:function(r){return null==r?"":""==r?null:(r=r.replace(/ /g,"+"),i._decompress(r.length,32,function(n){return o(e,r.charAt(n))}))},compress:function(o){return i._compress(o,16,function(o){return r(o)})},_compress:function(o,r,n){if(null==o)return"";var e,t,i,s={},p={},u="",c="",a="",l=2,f=3,h=2,d=[],m=0,v=0;for(i=0;i<o.length;i+=1)if(u=o.charAt(i),Object.prototype.hasOwnProperty.call(s,u)||(s[u]=f++,p[u]=!0),c=a+u,Object.prototype.hasOwnProperty.call(s,c))a=c;else{if(Object.prototype.hasOwnProperty.call(p,a)){if(a.charCodeAt(0)<256){for(e=0;h>e;e++)m<<=1,v==r-1?(v=0,d.push(n(m)),m=0):v++;for(t=a.charCodeAt(0),e=0;8>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}else{for(t=1,e=0;h>e;e++)m=m<<1|t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t=0;for(t=a.charCodeAt(0),e=0;16>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}l--,0==l&&(l=Math.pow(2,h),h++),delete p[a]}else for(t=s[a],e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;l--,0==l&&(l=Math.pow(2,h),h++),s[c]=f++,a=String(u)}if(""!==a){if(Object.prototype.hasOwnProperty.call(p,a)){if(a.charCodeAt(0)<256){for(e=0;h>e;e++)m<<=1,v==r-1?(v=0,d.push(n(m)),m=0):v++;for(t=a.charCodeAt(0),e=0;8>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}else{for(t=1,e=0;h>e;e++)m=m<<1|t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t=0;for(t=a.charCodeAt(0),e=0;16>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1}l--,0==l&&(l=Math.pow(2,h),h++),delete p[a]}else for(t=s[a],e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;l--,0==l&&(l=Math.pow(2,h),h++)}for(t=2,e=0;h>e;e++)m=m<<1|1&t,v==r-1?(v=0,d.push(n(m)),m=0):v++,t>>=1;for(;;){if(m<<=1,v==r-1){d.push(n(m));break}v++}return d.join("")},decompress:function(o){return null==o?"":""==o?null:i._decompress(o.length,32768,function(r){return o.charCodeAt(r)})},_decompress:function(o,n,e){var t,i,s,p,u,c,a,l,f=[],h=4,d=4,m=3,v="",w=[],A={val:e(0),position:n,index:1};for(i=0;3>i;i+=1)f[i]=i;for(p=0,c=Math.pow(2,2),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;switch(t=p){case 0:for(p=0,c=Math.pow(2,8),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;l=r(p);break;case 1:for(p=0,c=Math.pow(2,16),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;l=r(p);break;case 2:return""}for(f[3]=l,s=l,w.push(l);;){if(A.index>o)return"";for(p=0,c=Math.pow(2,m),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;switch(l=p){case 0:for(p=0,c=Math.pow(2,8),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;f[d++]=r(p),l=d-1,h--;break;case 1:for(p=0,c=Math.pow(2,16),a=1;a!=c;)u=A.val&A.position,A.position>>=1,0==A.position&&(A.position=n,A.val=e(A.index++)),p|=(u>0?1:0)*a,a<<=1;f[d++]=r(p),l=d-1,h--;break;case 2:return w.join("")}if(0==h&&(h=Math.pow(2,m),m++),f[l])v=f[l];else{if(l!==d)return null;v=s+s.charAt(0)}w.push(v),f[d++]=s+v.charAt(0),h--,s=v,0==h&&(h=Math.pow(2,m),m++)}}};return i}();"function"==typeof define&&define.amd?define(function(){return LZString}):"undefined"!=typeof module&&null!=module&&(module.exports=LZString);"""
+    # Set compressed=True to send the new layer as LZString Base64, for a much smaller console paste.
+    # The browser still decompresses the existing drawing and recompresses the combined one.
+    def to_nifty_add_layer_import(self, compressed=False):
+        return _write_to_string(self.write_nifty_add_layer_import, compressed=compressed)
 
-        # Raw json string
-        raw_json_string = json.dumps(self.to_nifty_object()).replace("\"", "\\\"").replace(" ", "")
+    # Write the import straight to a file (or file-like object), the drawing data is streamed line by line
+    def write_nifty_add_layer_import(self, file, compressed=False):
+        file.write(LZ_STRING)
 
         # Set up the json string of the new data
-        json_object = "var json_object = JSON.parse(\"" + raw_json_string + "\");"
+        if compressed:
+            json_data = _write_to_string(lambda output: write_nifty_json(self, output))
+            file.write("var json_object = JSON.parse(LZString.decompressFromBase64(\"" +
+                       lz_string.compress_to_base64(json_data) + "\"));")
+        else:
+            file.write("var json_object = JSON.parse(\"")
+            write_nifty_json(self, file, escape_quotes=True)
+            file.write("\");")
 
         # Save the canvas if there are any unsaved changes
         save_canvas = """var button = document.getElementsByTagName("button");
@@ -398,10 +1137,39 @@ class Drawing:
                             var json_string = JSON.stringify(decompressed_data);
                          };"""
 
+        file.write(save_canvas + local_storage_data + update_data)
+
         # Update the session storage with the escaped unicode point compressed json string
-        local_storage = """window.localStorage.setItem("drawing", JSON.stringify(LZString.compress(json_string)));"""
+        file.write("""window.localStorage.setItem("drawing", JSON.stringify(LZString.compress(json_string)));""")
 
         # Refresh the Create Ink page to show the new Canvas Ink Layer
-        refresh_page = "location.reload();"
+        file.write("location.reload();")
+        return self
+
+
+# Pauses (from add_pause) are invisible lines with no brush, that only take up time as Nifty Ink draws
+def _is_pause(colour, brush_radius):
+    return colour[3] == 0 and brush_radius == 0
+
+
+# Collect everything a write_* method writes into a string
+def _write_to_string(write_method, **kwargs):
+    output = io.StringIO()
+    write_method(output, **kwargs)
+    return output.getvalue()
+
+
+# Apply the add_line convention to many lines at once: every point apart from the first and last in a line is
+# repeated, so Nifty Ink draws a sharp corner there. A line with a single point becomes a dot. Empty lines are dropped.
+def _duplicate_corners(points, offsets):
+    lengths = np.diff(offsets)
+    offsets, lengths = offsets[:-1][lengths > 0], lengths[lengths > 0]
+
+    counts = np.full(len(points), 2)
+    counts[offsets] -= 1
+    counts[offsets + lengths - 1] -= 1
+    counts[offsets[lengths == 1]] = 2
 
-        return lz_string + json_object + save_canvas + local_storage_data + update_data + local_storage + refresh_page
+    new_offsets = np.zeros(len(offsets) + 1, np.int64)
+    np.cumsum(np.add.reduceat(counts, offsets) if len(offsets) else [], out=new_offsets[1:])
+    return np.repeat(points, counts, axis=0), new_offsets
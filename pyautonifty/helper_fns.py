@@ -1,7 +1,11 @@
+import datetime
+import functools
 import math
 import os
 import random
 
+import numpy as np
+
 from PIL import ImageColor
 
 from .pos import Pos
@@ -65,15 +69,65 @@ def hex_list_to_rgba(hex_list, alpha=1):
     return col_list
 
 
-# Obtained from https://orthallelous.wordpress.com/2020/06/21/pure-python-bezier-curve/
+# Bernstein basis for a bezier curve of the given degree, sampled at step_size evenly spaced values of t
+# (including t = 1 if end_point), as a (step_size x degree + 1) array. Multiplying it by a curve's control points
+# gives the points on the curve. Cached, as the same few are used for every curve drawn.
+@functools.lru_cache(maxsize=None)
+def bernstein_matrix(degree, step_size, end_point=True):
+    # Worked out with Python floats, as NumPy's power rounds differently for some exponents
+    s = step_size - 1 if end_point else step_size
+    matrix = np.array([[math.comb(degree, v) * (i / s) ** v * (1 - i / s) ** (degree - v) for v in range(degree + 1)]
+                       for i in range(step_size)], dtype=np.float64)
+    matrix.setflags(write=False)
+    return matrix
+
+
+# Evaluate many bezier curves of the same degree in one go
+# control_points is an (..., degree + 1, 2) array, returns the curve points as a (..., step_size, 2) array
+# The terms are added up one control point at a time, rather than with a matrix multiply, so every point comes out
+# exactly as working it out on its own would give (a matrix multiply may round differently)
+def get_bezier_curves(control_points, step_size=10, end_point=True):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    matrix = bernstein_matrix(control_points.shape[-2] - 1, step_size, end_point)
+    points = matrix[:, :1] * control_points[..., None, 0, :]
+    for index in range(1, matrix.shape[1]):
+        points = points + matrix[:, index:index + 1] * control_points[..., None, index, :]
+    return points
+
+
+# Number of points (evenly spaced in t, including both ends) needed for the straight segments between them to stay
+# within tolerance of each bezier curve. A curve of degree n bends by at most
+# |B''| <= n(n - 1) max|P[i] - 2P[i+1] + P[i+2]|, and a segment covering h of t is then within |B''| h^2 / 8 of it.
+# control_points is an (..., degree + 1, 2) array, returns an integer array of the point counts, at least 2
+def bezier_step_sizes(control_points, tolerance):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    degree = control_points.shape[-2] - 1
+    if degree < 2:
+        return np.full(control_points.shape[:-2], 2, dtype=np.int64)
+    second_differences = control_points[..., :-2, :] - 2 * control_points[..., 1:-1, :] + control_points[..., 2:, :]
+    bend = degree * (degree - 1) * np.max(np.hypot(second_differences[..., 0], second_differences[..., 1]), axis=-1)
+    segments = np.maximum(np.ceil(np.sqrt(bend / (8 * tolerance))), 1)
+    return segments.astype(np.int64) + 1
+
+
+# Evaluate many bezier curves of the same degree, each with as few points as keep it within tolerance
+# control_points is an (N x degree + 1 x 2) array, returns a list of N lists of [x, y] points
+# Curves needing the same number of points are evaluated together
+def get_adaptive_bezier_curves(control_points, tolerance):
+    control_points = np.asarray(control_points, dtype=np.float64)
+    step_sizes = bezier_step_sizes(control_points, tolerance)
+    curves = [None] * len(control_points)
+    for step_size in np.unique(step_sizes).tolist():
+        group = np.flatnonzero(step_sizes == step_size)
+        for index, curve in zip(group.tolist(), get_bezier_curves(control_points[group], step_size).tolist()):
+            curves[index] = curve
+    return curves
+
+
+# Points on a single bezier curve through (x, y) control points, as a list of (x, y) tuples
 # TODO: Change this over to using Pos instead of (x, y). Might be quite difficult
 def get_bezier_curve(control_points, step_size=10, end_point=True):
-    m, q, bezier_points, s = list(zip(*control_points)), len(control_points), [], (
-        step_size - 1 if end_point else step_size) / 1.
-    for i in range(step_size):
-        b = [math.comb(q - 1, v) * (i / s) ** v * (1 - (i / s)) ** (q - 1 - v) for v in range(q)]
-        bezier_points += [(tuple(sum(j * k for j, k in zip(d, b)) for d in m))]
-    return bezier_points
+    return [tuple(point) for point in get_bezier_curves(control_points, step_size, end_point).tolist()]
 
 
 # Range-check any number into an integer within specified upper and lower bounds
@@ -92,6 +146,32 @@ def interpolate_colour(start_col, end_col, amount, alpha_factor=1):
     return r, g, b, a
 
 
+# Format a number as compactly as possible, whole numbers are written without a decimal point
+def format_number(num):
+    if num == int(num):
+        return str(int(num))
+    return repr(float(num))
+
+
+# Convert a numeric (R, G, B, A) colour into the string form Nifty Ink uses
+# Opaque colours use the shorter "rgb(r,g,b)" form
+def colour_to_string(colour):
+    if colour[3] == 1:
+        return "rgb({},{},{})".format(*[format_number(cell) for cell in colour[:3]])
+    return "rgba({},{},{},{})".format(*[format_number(cell) for cell in colour])
+
+
+# Parse an "rgba(r,g,b,a)" or "rgb(r,g,b)" colour string back into a numeric (R, G, B, A) tuple
+# Colours that are already numeric are returned as a tuple
+def string_to_colour(colour):
+    if not isinstance(colour, str):
+        return tuple(colour)
+    values = [float(cell) for cell in colour[colour.index("(") + 1:-1].split(",")]
+    if len(values) == 3:
+        values.append(1)
+    return tuple(values)
+
+
 def alpha_blend(a, bg, fg):
     return ((1 - a) * fg[0] + a * bg[0],
             (1 - a) * fg[1] + a * bg[1],
@@ -99,6 +179,14 @@ def alpha_blend(a, bg, fg):
             255)
 
 
+# Fill in the time in an output file name, %s is replaced by the Unix timestamp, and the rest is formatted with
+# datetime's strftime format codes
+def timestamped_filename(filename):
+    current_time = datetime.datetime.now()
+    filename = filename.replace('%s', str(int(current_time.timestamp())))
+    return current_time.strftime(filename)
+
+
 def random_seed():
     seed = int.from_bytes(os.urandom(8), byteorder="big")
     random.seed(seed)
@@ -0,0 +1,208 @@
+import collections
+import concurrent.futures
+import itertools
+import math
+import os
+import shutil
+
+import numpy as np
+
+from .constants import DRAWING_SIZE
+from .helper_fns import string_to_colour, timestamped_filename
+from .png_writer import PngWriter
+from .raster_helper_fns import Canvas
+
+# Extra pixels drawn around each tile or band when rendering in pieces
+TILE_MARGIN = 16
+
+
+# A renderer that needs no pygame or display, for thumbnails, CI and batch jobs.
+# Lines are rasterised with NumPy and PIL the way Nifty Ink draws them: quadratic curves from midpoint to midpoint,
+# round caps and joins, the brush radius as the stroke width, and real alpha compositing.
+# The result is close to Renderer.render with proper_line_thickness, draw_as_bezier and allow_transparency on.
+# render is called the same way as on Renderer, e.g. ImageRenderer().render(drawing, filename="thumbnail.png")
+#
+# With processes above 1 (or None for one per CPU), the image is split into square tiles tile_size pixels across,
+# and each tile is rendered in a worker process from just the lines whose bounds touch it (found with the drawing's
+# spatial index, so the lines stay in drawing order), then the tiles are stitched together.
+# As with any process pool, scripts using this should run from inside an if __name__ == '__main__': block.
+#
+# render_bands is for print sized images (e.g. scale=20 for 20000 x 20000) that are too big to hold in memory.
+# It renders one horizontal band of the image at a time and streams the rows straight into a PNG file.
+#
+# render_animation records the drawing being drawn, like Renderer.render with simulate on, but as fast as the frames
+# can be made instead of in real time. Lines are drawn onto one canvas, each frame only adding the lines since the last.
+
+class ImageRenderer:
+    def __init__(self, scale=1, supersample=2, processes=1, tile_size=512):
+        self.scale = scale
+        self.supersample = supersample
+        self.processes = processes
+        self.tile_size = tile_size
+        self.size = round(DRAWING_SIZE * scale)
+        self.canvas = None
+
+    # Render the lines and save the image, filename can include the time in the same way as in Renderer.render
+    # tolerance is how far (in pixels) the drawn curves may be from the true curves
+    # save_transparent_bg saves the image with a transparent background instead of white
+    def render(self, drawing, filename="output.png", save_transparent_bg=False, tolerance=0.25):
+        if self.processes == 1:
+            self.canvas = _render_region(drawing._iter_line_arrays(), (0, 0, self.size, self.size), self.scale,
+                                         self.supersample, tolerance, save_transparent_bg)
+        else:
+            self.canvas = self._render_tiles(drawing, save_transparent_bg, tolerance)
+        self.canvas.to_image().save(timestamped_filename(filename))
+
+    # Render each tile in a process pool, then stitch them together
+    def _render_tiles(self, drawing, transparent, tolerance):
+        line_arrays = list(drawing._iter_line_arrays())
+        tiles = []
+        for y in range(0, self.size, self.tile_size):
+            for x in range(0, self.size, self.tile_size):
+                tile = (x, y, min(x + self.tile_size, self.size), min(y + self.tile_size, self.size))
+                # PIL draws shapes cut off at the edge of an image slightly differently, so each tile is drawn with a
+                # margin around it (where it is not the edge of the image), which is then cut off again
+                region = (max(tile[0] - TILE_MARGIN, 0), max(tile[1] - TILE_MARGIN, 0),
+                          min(tile[2] + TILE_MARGIN, self.size), min(tile[3] + TILE_MARGIN, self.size))
+                bbox = [value / self.scale for value in region]
+                tiles.append(([line_arrays[index] for index in drawing.query(bbox).tolist()], region, tile))
+
+        canvas = Canvas(self.size, self.size, transparent=transparent)
+        with concurrent.futures.ProcessPoolExecutor(self.processes) as executor:
+            futures = [(executor.submit(_render_region, tile_lines, region, self.scale, self.supersample, tolerance,
+                                        transparent), tile) for tile_lines, region, tile in tiles if tile_lines]
+            for future, tile in futures:
+                canvas.paste(future.result(), tile)
+        return canvas
+
+    # Render the image one band of rows at a time, writing each band to a PNG file as soon as it is done, so only a
+    # band (band_height pixels tall) of the image is ever held in memory. The lines are bucketed by their bounds first,
+    # so each band only draws the lines that touch it. Takes the same options as render.
+    # With processes above 1 (or None for one per CPU), bands are rendered in a process pool, one band per process
+    # at a time. Returns the name of the file written
+    def render_bands(self, drawing, filename="output.png", band_height=256, save_transparent_bg=False, tolerance=0.25):
+        band_lines = self._bucket_lines(drawing, band_height)
+        bands = []
+        for band, indices in enumerate(band_lines):
+            rows = (band * band_height, min((band + 1) * band_height, self.size))
+            region = (0, max(rows[0] - TILE_MARGIN, 0), self.size, min(rows[1] + TILE_MARGIN, self.size))
+            bands.append((indices, region, rows))
+
+        def band_arrays(indices):
+            return list(drawing._subset(indices)._iter_line_arrays()) if len(indices) else []
+
+        filename = timestamped_filename(filename)
+        self.canvas = None
+        with PngWriter(filename, self.size, self.size, transparent=save_transparent_bg) as writer:
+            def write_band(canvas, rows):
+                pixels = np.asarray(canvas.to_image())
+                writer.write_rows(pixels[rows[0] - canvas.origin[1]:rows[1] - canvas.origin[1]])
+
+            if self.processes == 1:
+                for indices, region, rows in bands:
+                    write_band(_render_region(band_arrays(indices), region, self.scale, self.supersample, tolerance,
+                                              save_transparent_bg), rows)
+                return filename
+
+            # Only keep as many bands in flight as there are processes, so finished bands don't pile up in memory
+            workers = self.processes or os.cpu_count() or 1
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                pending = collections.deque()
+                for indices, region, rows in bands:
+                    pending.append((executor.submit(_render_region, band_arrays(indices), region, self.scale,
+                                                    self.supersample, tolerance, save_transparent_bg), rows))
+                    if len(pending) > workers:
+                        future, band_rows = pending.popleft()
+                        write_band(future.result(), band_rows)
+                for future, band_rows in pending:
+                    write_band(future.result(), band_rows)
+        return filename
+
+    # Render the drawing being drawn line by line as an animation, returning the number of frames
+    # filename is either a pattern for numbered PNG frames, such as "frames/frame_{:05d}.png", which are written as they
+    # are made, or the name of an animation file (e.g. "preview.gif" or "preview.webp") in any format PIL can save all
+    # the frames of. PIL holds on to every frame while it builds an animation file, so keep those short or small.
+    # Frames are fps per second apart. lines_per_frame draws that many lines (which can be fractional) each frame,
+    # otherwise speed sets the pace in the same way as Renderer.render's simulate speed, a line every speed / 100 seconds
+    # (3 is roughly the speed Nifty Ink draws at)
+    def render_animation(self, drawing, filename="frame_{:05d}.png", fps=30, speed=3, lines_per_frame=None,
+                         save_transparent_bg=False, tolerance=0.25):
+        if lines_per_frame is None:
+            if not speed:
+                raise ValueError("Either speed or lines_per_frame is needed to time the animation")
+            lines_per_frame = 100 / (speed * fps)
+        if lines_per_frame <= 0:
+            raise ValueError("lines_per_frame must be above 0")
+        frames = self._animation_frames(drawing, lines_per_frame, save_transparent_bg, tolerance)
+
+        if "{" not in filename:
+            first_frame, _ = next(frames)
+            frame_count = 1
+
+            def other_frames():
+                nonlocal frame_count
+                for image, _ in frames:
+                    frame_count += 1
+                    yield image
+
+            first_frame.save(timestamped_filename(filename), save_all=True, append_images=other_frames(),
+                             duration=round(1000 / fps), loop=0)
+            return frame_count
+
+        # Frames with no new lines are the same as the last one, so are copied rather than encoded again
+        previous_name = None
+        for number, (image, changed) in enumerate(frames):
+            frame_name = filename.format(number)
+            if changed:
+                image.save(frame_name)
+            else:
+                shutil.copyfile(previous_name, frame_name)
+            previous_name = frame_name
+        return number + 1
+
+    # Draw the lines onto one canvas, a few at a time, yielding the image after each frame's lines have been drawn
+    # along with whether any lines were drawn for it. The first frame is the blank canvas, the last shows every line
+    def _animation_frames(self, drawing, lines_per_frame, transparent, tolerance):
+        self.canvas = Canvas(self.size, self.size, transparent=transparent)
+        line_arrays = drawing._iter_line_arrays()
+        line_count = len(drawing)
+        drawn = 0
+        for frame in itertools.count():
+            # The small allowance stops rounding error leaving a line out of the frame that should finish it
+            shown = min(math.floor(frame * lines_per_frame + 1e-9), line_count)
+            for points, colour, brush_radius in itertools.islice(line_arrays, shown - drawn):
+                self.canvas.draw_line(points, string_to_colour(colour), brush_radius, self.scale, tolerance,
+                                      self.supersample)
+            yield self.canvas.to_image(), frame == 0 or shown > drawn
+            drawn = shown
+            if drawn == line_count:
+                return
+
+    # The lines (by index, in drawing order) that touch each band of rows, with the margin drawn around each band
+    # Lines are bucketed by the vertical extent of their bounds, lines entirely outside the image are left out
+    def _bucket_lines(self, drawing, band_height):
+        band_count = -(-self.size // band_height)
+        _, _, lower, upper, _ = drawing._line_bounds()
+        lower, upper = lower * self.scale, upper * self.scale
+        # Lines with no points have NaN bounds, which fail these comparisons
+        visible = np.flatnonzero(np.all((upper >= 0) & (lower <= self.size), axis=1))
+
+        first = np.clip(np.floor((lower[visible, 1] - TILE_MARGIN) / band_height), 0, band_count - 1).astype(np.int64)
+        last = np.clip(np.floor((upper[visible, 1] + TILE_MARGIN) / band_height), 0, band_count - 1).astype(np.int64)
+
+        # Every (band, line) pair, sorted by band, keeping the lines of each band in drawing order
+        counts = last - first + 1
+        lines = np.repeat(visible, counts)
+        bands = np.repeat(first, counts) + np.arange(len(lines)) - np.repeat(np.cumsum(counts) - counts, counts)
+        band_order = np.argsort(bands, kind="stable")
+        lines = lines[band_order]
+        offsets = np.searchsorted(bands[band_order], np.arange(band_count + 1))
+        return [lines[offsets[band]:offsets[band + 1]] for band in range(band_count)]
+
+
+# Render lines, as (points, colour, brush radius) tuples, onto a new canvas of the region (x0, y0, x1, y1) of the image
+def _render_region(line_arrays, region, scale, supersample, tolerance, transparent):
+    canvas = Canvas(region[2] - region[0], region[3] - region[1], origin=region[:2], transparent=transparent)
+    for points, colour, brush_radius in line_arrays:
+        canvas.draw_line(points, string_to_colour(colour), brush_radius, scale, tolerance, supersample)
+    return canvas
@@ -0,0 +1,78 @@
+import struct
+
+import numpy as np
+
+from .constants import DRAWING_SIZE
+from .line_store import LineStore
+
+
+# A compact binary container for drawings, much smaller and faster to load than the JSON raw data.
+# The layout is:
+#   header       - magic, version, point precision, canvas size, number of lines and points (padded to 64 bytes)
+#   line table   - int64 offsets, one per line plus one, giving where each line starts in the point block
+#   point block  - float32 or float64 (x, y) pairs for every point of every line
+#   colour block - float64 (r, g, b, a) for each line, followed by a float64 brush radius for each line
+# Every block is a whole number of 8 byte words, so all of them can be memory-mapped straight into a LineStore.
+
+MAGIC = b"NIFTYINK"
+VERSION = 1
+HEADER_FORMAT = "<8sHBBIIQQ"
+HEADER_SIZE = 64
+
+
+# Check whether a file starts with the binary drawing magic bytes
+def is_ink_file(file_name):
+    with open(file_name, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+# Write a LineStore to a binary file, with points stored as float32 or float64
+def write_ink_file(lines, file_name, dtype=np.float64):
+    dtype = np.dtype(dtype)
+    if dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+        raise ValueError("Points can only be stored as float32 or float64")
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, dtype.itemsize, 0,
+                         DRAWING_SIZE, DRAWING_SIZE, len(lines), lines.point_count())
+    with open(file_name, "wb") as file:
+        file.write(header.ljust(HEADER_SIZE, b"\0"))
+        np.ascontiguousarray(lines.offsets, dtype="<i8").tofile(file)
+        np.ascontiguousarray(lines.points, dtype=dtype.newbyteorder("<")).tofile(file)
+        np.ascontiguousarray(lines.colours, dtype="<f8").tofile(file)
+        np.ascontiguousarray(lines.radii, dtype="<f8").tofile(file)
+
+
+# Load a binary file as a LineStore
+# With memory_map=True the blocks are mapped copy-on-write rather than read, so lines are only paged in from disk
+# when they are used, and changes to the drawing never touch the file
+def read_ink_file(file_name, memory_map=True):
+    with open(file_name, "rb") as file:
+        header = file.read(HEADER_SIZE)
+    magic, version, itemsize, _, _, _, line_count, point_count = struct.unpack_from(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise ValueError(f"{file_name} is not a binary drawing file")
+    if version > VERSION:
+        raise ValueError(f"{file_name} uses binary drawing format version {version}, newer than this code supports")
+    point_dtype = np.dtype("<f4") if itemsize == 4 else np.dtype("<f8")
+
+    # (name, dtype, shape) of each block, in the order they appear in the file
+    blocks = [("offsets", np.dtype("<i8"), (line_count + 1,)),
+              ("points", point_dtype, (point_count, 2)),
+              ("colours", np.dtype("<f8"), (line_count, 4)),
+              ("radii", np.dtype("<f8"), (line_count,))]
+
+    arrays = {}
+    offset = HEADER_SIZE
+    with open(file_name, "rb") as file:
+        for name, dtype, shape in blocks:
+            count = int(np.prod(shape))
+            if count == 0:
+                arrays[name] = np.zeros(shape, dtype)
+            elif memory_map:
+                arrays[name] = np.memmap(file_name, dtype=dtype, mode="c", offset=offset, shape=shape)
+            else:
+                file.seek(offset)
+                arrays[name] = np.fromfile(file, dtype=dtype, count=count).reshape(shape)
+            offset += count * dtype.itemsize
+
+    return LineStore.from_arrays(arrays["points"], arrays["offsets"], arrays["colours"], arrays["radii"])
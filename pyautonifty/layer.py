@@ -0,0 +1,15 @@
+# A Layer is a drawing added on top of another drawing with +, together with the operations (such as transforms)
+# applied to the drawing it was added to since then, which still need to be applied to the layer's lines.
+# pending is a list of (method name, arguments) pairs, replayed in order on a copy of the lines when the layers of
+# the drawing are flattened, so the layer's own drawing is never changed.
+# An owned layer holds lines added to the drawing after its layers, and new lines can be added straight to its drawing
+# while it has no pending operations.
+
+class Layer:
+    def __init__(self, drawing, owned=False):
+        self.drawing = drawing
+        self.pending = []
+        self.owned = owned
+
+    def __len__(self):
+        return len(self.drawing)
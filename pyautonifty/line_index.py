@@ -0,0 +1,83 @@
+import numpy as np
+
+from .constants import DRAWING_SIZE
+from .line_store import _grow
+
+
+# A uniform grid over the canvas, indexing the bounding boxes of a drawing's lines (widened by the brush radius),
+# to quickly find which lines touch a rectangle without looking at every line.
+# Lines are numbered in drawing order, and are only ever added to the end, which keeps the index cheap to update.
+# Each line is listed in every grid cell its bounding box touches, lines off the canvas are listed in the nearest
+# cells on the edge. Very large lines (such as backgrounds) would be listed in most of the cells,
+# so lines touching more than max_cells cells are kept in a separate list that is checked on every query instead.
+
+class LineIndex:
+    def __init__(self, resolution=64, canvas_size=DRAWING_SIZE, max_cells=64):
+        self.resolution = resolution
+        self.cell_size = canvas_size / resolution
+        self.max_cells = max_cells
+        self.cells = [[] for _ in range(resolution * resolution)]
+        self.large_lines = []
+        self._lower = np.empty((0, 2))
+        self._upper = np.empty((0, 2))
+        self._line_count = 0
+
+    def __len__(self):
+        return self._line_count
+
+    # Bounding box corners of every line in the index, lines with no points have NaN corners
+    @property
+    def lower(self):
+        return self._lower[:self._line_count]
+
+    @property
+    def upper(self):
+        return self._upper[:self._line_count]
+
+    # Grid cells (first and last, inclusive) covered by bounding boxes, clamped to the grid
+    def _cell_ranges(self, lower, upper):
+        first = np.clip(np.floor(lower / self.cell_size), 0, self.resolution - 1)
+        last = np.clip(np.floor(upper / self.cell_size), 0, self.resolution - 1)
+        return first.astype(np.int64), last.astype(np.int64)
+
+    # Add the next lines of the drawing, given the lower and upper corners of their bounding boxes (N x 2 arrays)
+    def add(self, lower, upper):
+        lower, upper = np.asarray(lower, dtype=np.float64), np.asarray(upper, dtype=np.float64)
+        first_index, count = self._line_count, len(lower)
+        if first_index + count > len(self._lower):
+            capacity = max(1024, first_index + count, 2 * len(self._lower))
+            self._lower = _grow(self._lower, capacity, first_index)
+            self._upper = _grow(self._upper, capacity, first_index)
+        self._lower[first_index:first_index + count] = lower
+        self._upper[first_index:first_index + count] = upper
+        self._line_count += count
+
+        present = ~np.isnan(lower[:, 0])
+        first, last = self._cell_ranges(np.nan_to_num(lower), np.nan_to_num(upper))
+        cell_counts = np.prod(last - first + 1, axis=1)
+        for index, (x0, y0), (x1, y1), cell_count, has_points in zip(range(first_index, first_index + count),
+                                                                      first.tolist(), last.tolist(),
+                                                                      cell_counts.tolist(), present.tolist()):
+            if not has_points:
+                continue
+            if cell_count > self.max_cells:
+                self.large_lines.append(index)
+                continue
+            for y in range(y0, y1 + 1):
+                for cell in range(y * self.resolution + x0, y * self.resolution + x1 + 1):
+                    self.cells[cell].append(index)
+
+    # Indices of the lines whose bounding box touches the rectangle (x0, y0, x1, y1), in drawing order
+    def query(self, bbox):
+        x0, y0, x1, y1 = bbox
+        lower, upper = np.array([min(x0, x1), min(y0, y1)]), np.array([max(x0, x1), max(y0, y1)])
+        first, last = self._cell_ranges(lower, upper)
+
+        candidates = list(self.large_lines)
+        for y in range(first[1], last[1] + 1):
+            for cell in range(y * self.resolution + first[0], y * self.resolution + last[0] + 1):
+                candidates.extend(self.cells[cell])
+        candidates = np.unique(np.array(candidates, dtype=np.int64))
+
+        touching = np.all((self.lower[candidates] <= upper) & (self.upper[candidates] >= lower), axis=1)
+        return candidates[touching]
@@ -0,0 +1,176 @@
+import numpy as np
+
+from .pos import Pos
+from .helper_fns import string_to_colour
+
+
+# The LineStore class is an alternative, array-backed storage engine for the lines of a Drawing.
+# Instead of a list of dicts each holding a list of Pos objects and a colour tuple,
+# all the points live in one contiguous float buffer, with an offsets array marking where each line starts,
+# and the colours and brush radii are kept in numeric columns.
+# It behaves enough like the list of lines for Drawing to use it in place of one,
+# and large drawings use a fraction of the memory.
+
+INITIAL_LINE_CAPACITY = 64
+INITIAL_POINT_CAPACITY = 256
+
+
+class LineStore:
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self._line_count = 0
+        self._point_count = 0
+        self._points = np.empty((INITIAL_POINT_CAPACITY, 2), self.dtype)
+        self._offsets = np.zeros(INITIAL_LINE_CAPACITY + 1, np.int64)
+        self._colours = np.empty((INITIAL_LINE_CAPACITY, 4), np.float64)
+        self._radii = np.empty(INITIAL_LINE_CAPACITY, np.float64)
+
+    # Build a store directly from complete columns, without copying them
+    # points is N x 2, offsets has one more entry than there are lines, colours is M x 4 and radii has M entries
+    @staticmethod
+    def from_arrays(points, offsets, colours, radii):
+        store = LineStore(points.dtype)
+        store._line_count = len(radii)
+        store._point_count = len(points)
+        store._points = points
+        store._offsets = offsets
+        store._colours = colours
+        store._radii = radii
+        return store
+
+    # Views onto the used part of each column
+    @property
+    def points(self):
+        return self._points[:self._point_count]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self._line_count + 1]
+
+    @property
+    def colours(self):
+        return self._colours[:self._line_count]
+
+    @property
+    def radii(self):
+        return self._radii[:self._line_count]
+
+    def point_count(self):
+        return self._point_count
+
+    # Make sure there is room for extra lines and points, growing the buffers geometrically
+    def _reserve(self, extra_lines, extra_points):
+        needed_lines = self._line_count + extra_lines
+        if needed_lines > len(self._radii) or not self._radii.flags.writeable:
+            capacity = max(INITIAL_LINE_CAPACITY, needed_lines, 2 * len(self._radii))
+            self._offsets = _grow(self._offsets, capacity + 1, self._line_count + 1)
+            self._colours = _grow(self._colours, capacity, self._line_count)
+            self._radii = _grow(self._radii, capacity, self._line_count)
+
+        needed_points = self._point_count + extra_points
+        if needed_points > len(self._points) or not self._points.flags.writeable:
+            capacity = max(INITIAL_POINT_CAPACITY, needed_points, 2 * len(self._points))
+            self._points = _grow(self._points, capacity, self._point_count)
+
+    # Add a single line, points can be a list of Pos or anything that converts to an N x 2 array
+    def append(self, points, colour, brush_radius):
+        if len(points) and isinstance(points[0], Pos):
+            points = [(pos.x, pos.y) for pos in points]
+        points = np.asarray(points, dtype=self.dtype).reshape(-1, 2)
+
+        self._reserve(1, len(points))
+        start = self._point_count
+        self._points[start:start + len(points)] = points
+        self._point_count += len(points)
+        self._colours[self._line_count] = colour
+        self._radii[self._line_count] = brush_radius
+        self._line_count += 1
+        self._offsets[self._line_count] = self._point_count
+
+    # Add many lines in one operation
+    # points is N x 2, offsets marks the start of each line within points (with or without the final end offset),
+    # colours is M x 4 (or a single colour for every line), radii has M entries (or a single radius)
+    def append_many(self, points, offsets, colours, radii):
+        points = np.asarray(points, dtype=self.dtype).reshape(-1, 2)
+        offsets = complete_offsets(offsets, len(points))
+        line_count = len(offsets) - 1
+
+        self._reserve(line_count, len(points))
+        start_line, start_point = self._line_count, self._point_count
+        self._points[start_point:start_point + len(points)] = points
+        self._offsets[start_line + 1:start_line + line_count + 1] = offsets[1:] - offsets[0] + start_point
+        self._colours[start_line:start_line + line_count] = colours
+        self._radii[start_line:start_line + line_count] = radii
+        self._line_count += line_count
+        self._point_count += len(points)
+
+    # Add lines from another LineStore in bulk, or from any iterable of line dicts
+    def extend(self, lines):
+        if isinstance(lines, LineStore):
+            self.append_many(lines.points, lines.offsets, lines.colours, lines.radii)
+            return
+        for line in lines:
+            self.append(line["points"], string_to_colour(line["brushColor"]), line["brushRadius"])
+
+    # Return a new store with the lines rearranged (or selected) by a list of line indices
+    def take(self, order):
+        order = np.asarray(order, dtype=np.int64)
+        offsets = self.offsets
+        starts = offsets[:-1][order]
+        lengths = offsets[1:][order] - starts
+
+        new_offsets = np.zeros(len(order) + 1, np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        # For every output point, the index of the input point it comes from
+        point_index = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+
+        return LineStore.from_arrays(self.points[point_index], new_offsets,
+                                     self.colours[order], self.radii[order])
+
+    # Return a new store holding its own copy of the lines
+    def copy(self):
+        return LineStore.from_arrays(self.points.copy(), self.offsets.copy(), self.colours.copy(), self.radii.copy())
+
+    def line_points(self, index):
+        return self.points[self._offsets[index]:self._offsets[index + 1]]
+
+    def __len__(self):
+        return self._line_count
+
+    # Lines are handed out as dicts in the same form as a list-backed Drawing stores them
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(self._line_count)))
+        if index < 0:
+            index += self._line_count
+        if not 0 <= index < self._line_count:
+            raise IndexError("line index out of range")
+        return {"points": [Pos(x, y) for x, y in self.line_points(index).tolist()],
+                "brushColor": tuple(self._colours[index].tolist()),
+                "brushRadius": self._radii[index].item()}
+
+    def __iter__(self):
+        for index in range(self._line_count):
+            yield self[index]
+
+
+# Copy the used part of an array into a new, larger buffer
+def _grow(array, capacity, used):
+    result = np.empty((capacity,) + array.shape[1:], array.dtype)
+    result[:used] = array[:used]
+    return result
+
+
+# Offsets may be given with or without the final end offset, always return them with it
+def complete_offsets(offsets, point_count):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) == 0 or offsets[-1] != point_count:
+        offsets = np.append(offsets, point_count)
+    return offsets
+
+
+# If every value in the array is a whole number, return it as integers so it serialises compactly
+def compact_numbers(array):
+    if array.size and np.all(np.isfinite(array)) and np.all(array == np.round(array)):
+        return array.astype(np.int64)
+    return array
@@ -0,0 +1,93 @@
+from array import array
+
+
+# A Python implementation of the compression side of LZString
+# https://github.com/pieroxy/lz-string
+# This gives exactly the same output as LZString.compress and LZString.compressToBase64 in the browser,
+# so drawings can be compressed here instead of in the web page.
+
+BASE64_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+# Same as LZString.compress, returns a string of 16 bit characters (which may include lone surrogates)
+def compress(uncompressed):
+    return "".join(map(chr, _compress(uncompressed, 16)))
+
+
+# Same as LZString.compressToBase64, returns a plain ASCII string
+def compress_to_base64(uncompressed):
+    result = "".join([BASE64_ALPHABET[value] for value in _compress(uncompressed, 6)])
+    return result + "=" * (-len(result) % 4)
+
+
+# Javascript strings are made of UTF-16 code units, so characters outside the Basic Multilingual Plane
+# become two (surrogate) characters before compressing, just like in the browser
+def _utf16_units(text):
+    if text.isascii():
+        return text
+    return "".join(map(chr, array("H", text.encode("utf-16-le", "surrogatepass"))))
+
+
+# The LZW style compressor from LZString, returning the output as a list of integers of bits_per_char bits each
+# Each value is written to the bit stream least significant bit first, so the bits are gathered as reversed
+# binary strings, which is much faster in Python than the bit by bit loop of the original.
+def _compress(uncompressed, bits_per_char):
+    dictionary = {}
+    to_create = set()
+    w = ""
+    enlarge_in = 2
+    dict_size = 3
+    num_bits = 2
+    bits = []
+
+    def write(value, width):
+        bits.append(format(value, "0{}b".format(width))[::-1])
+
+    # Write out the current phrase w, adding its first character to the dictionary if this is the first time it is used
+    def emit(w, enlarge_in, num_bits):
+        if w in to_create:
+            if ord(w) < 256:
+                write(0, num_bits)
+                write(ord(w), 8)
+            else:
+                write(1, num_bits)
+                write(ord(w), 16)
+            enlarge_in -= 1
+            if enlarge_in == 0:
+                enlarge_in = 2 ** num_bits
+                num_bits += 1
+            to_create.discard(w)
+        else:
+            write(dictionary[w], num_bits)
+
+        enlarge_in -= 1
+        if enlarge_in == 0:
+            enlarge_in = 2 ** num_bits
+            num_bits += 1
+        return enlarge_in, num_bits
+
+    for c in _utf16_units(uncompressed):
+        if c not in dictionary:
+            dictionary[c] = dict_size
+            dict_size += 1
+            to_create.add(c)
+
+        wc = w + c
+        if wc in dictionary:
+            w = wc
+        else:
+            enlarge_in, num_bits = emit(w, enlarge_in, num_bits)
+            dictionary[wc] = dict_size
+            dict_size += 1
+            w = c
+
+    if w != "":
+        enlarge_in, num_bits = emit(w, enlarge_in, num_bits)
+
+    # Mark the end of the stream
+    write(2, num_bits)
+
+    # Pad to a whole number of characters, like the original this always adds at least one extra bit
+    bit_string = "".join(bits)
+    bit_string += "0" * (bits_per_char - len(bit_string) % bits_per_char)
+    return [int(bit_string[i:i + bits_per_char], 2) for i in range(0, len(bit_string), bits_per_char)]
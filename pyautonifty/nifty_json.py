@@ -0,0 +1,86 @@
+import json
+import re
+
+from .constants import DRAWING_SIZE
+from .helper_fns import colour_to_string
+
+
+# Streaming JSON serialiser for drawings.
+# Rather than building the whole nifty object and dumping it in one go, each line is encoded on its own
+# and written straight to the file, so the extra memory needed does not grow with the size of the drawing.
+# The output is compact (no spaces), and can optionally have its quotes escaped,
+# ready to be placed inside a double quoted Javascript string.
+
+ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+# Characters that cannot appear as they are inside a double quoted Javascript string in a UTF-8 file
+JS_ESCAPE_PATTERN = re.compile('[\\x00-\\x1f"\\\\\u2028\u2029\ud800-\udfff]')
+
+# Lines are gathered into chunks of this many characters before being written, so there are fewer write calls
+WRITE_CHUNK_SIZE = 1 << 16
+
+
+# Encode one line (in the form given by Drawing.iter_nifty_lines) as compact JSON
+def encode_nifty_line(line, escape_quotes=False):
+    text = ENCODER.encode(line)
+    if escape_quotes:
+        text = text.replace('"', '\\"')
+    return text
+
+
+# Number of characters the given points (an N x 2 array) take up in compact JSON, including a comma after each one
+# Encoded as one list, which is the points and the commas between them plus the two brackets
+def points_json_size(points):
+    if len(points) == 0:
+        return 0
+    return len(ENCODER.encode([{"x": x, "y": y} for x, y in points.tolist()])) - 1
+
+
+# Number of characters a whole line takes up in compact JSON, including the comma after it
+def line_json_size(points, colour, brush_radius):
+    return (points_json_size(points) - (1 if len(points) else 0) +
+            len(ENCODER.encode({"points": [], "brushColor": colour_to_string(colour), "brushRadius": brush_radius})) + 1)
+
+
+# Total of line_json_size over many lines, given as (points, colour, brush radius) tuples, encoded all in one go
+def lines_json_size(line_arrays):
+    lines = [{"points": [{"x": x, "y": y} for x, y in points.tolist()], "brushColor": colour_to_string(colour),
+              "brushRadius": brush_radius} for points, colour, brush_radius in line_arrays]
+    return len(ENCODER.encode(lines)) - 1 if lines else 0
+
+
+# Number of characters the given lines (in the form given by Drawing.iter_nifty_lines) take up in compact JSON,
+# including the commas between them
+def nifty_lines_size(lines, escape_quotes=False):
+    size = sum(len(encode_nifty_line(line, escape_quotes)) + 1 for line in lines)
+    return max(size - 1, 0)
+
+
+# Write a drawing as compact JSON to a file or file-like object, one line at a time
+def write_nifty_json(drawing, file, escape_quotes=False):
+    quote = '\\"' if escape_quotes else '"'
+    file.write("{" + quote + "lines" + quote + ":[")
+
+    chunk = []
+    chunk_size = 0
+    for index, line in enumerate(drawing.iter_nifty_lines()):
+        text = encode_nifty_line(line, escape_quotes)
+        if index:
+            text = "," + text
+        chunk.append(text)
+        chunk_size += len(text)
+        if chunk_size >= WRITE_CHUNK_SIZE:
+            file.write("".join(chunk))
+            chunk = []
+            chunk_size = 0
+    file.write("".join(chunk))
+
+    file.write("]," + quote + "width" + quote + ":" + str(DRAWING_SIZE) + "," +
+               quote + "height" + quote + ":" + str(DRAWING_SIZE) + "}")
+
+
+# Turn any string into a double quoted Javascript string literal.
+# Only characters that have to be escaped are, everything else is written as it is (so the file must be UTF-8).
+# Lone surrogates, as found in LZString compressed output, are written as \uXXXX escapes.
+def to_js_string_literal(text):
+    return '"' + JS_ESCAPE_PATTERN.sub(lambda match: "\\u{:04x}".format(ord(match.group())), text) + '"'
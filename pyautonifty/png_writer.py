@@ -0,0 +1,71 @@
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+# Writes a PNG file a band of rows at a time, so images far too big to hold in memory can still be saved.
+# Rows are given as H x width x 3 (RGB) or H x width x 4 (RGBA) uint8 arrays, top to bottom, and compressed as they
+# arrive. Each row uses the PNG "Sub" filter (the difference from the pixel to its left), which shrinks the flat areas
+# and smooth strokes of a drawing far more than storing the bytes as they are.
+# Use it as a context manager, or call close once every row has been written.
+
+class PngWriter:
+    def __init__(self, file_name, width, height, transparent=False, compress_level=6):
+        self.width = width
+        self.height = height
+        self.channels = 4 if transparent else 3
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._file = open(file_name, "wb")
+        self._file.write(PNG_SIGNATURE)
+        # 8 bits per channel, colour type 6 (RGBA) or 2 (RGB), default compression, filtering and no interlacing
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6 if transparent else 2, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)) + chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    # Add rows to the bottom of the image
+    def write_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.shape[1:] != (self.width, self.channels):
+            raise ValueError(f"Expected rows of shape (N, {self.width}, {self.channels}), got {rows.shape}")
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError(f"Too many rows for an image {self.height} pixels tall")
+
+        rows = rows.reshape(len(rows), -1)
+        filtered = np.empty((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:self.channels + 1] = rows[:, :self.channels]
+        np.subtract(rows[:, self.channels:], rows[:, :-self.channels], out=filtered[:, self.channels + 1:])
+
+        compressed = self._compressor.compress(filtered.tobytes())
+        if compressed:
+            self._write_chunk(b"IDAT", compressed)
+        self.rows_written += len(rows)
+        return self
+
+    # Finish the image and close the file
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Only {self.rows_written} of {self.height} rows were written")
+            self._write_chunk(b"IDAT", self._compressor.flush())
+            self._write_chunk(b"IEND", b"")
+        finally:
+            self._file.close()
@@ -0,0 +1,221 @@
+import numpy as np
+
+
+# Helper functions for working on the points of a single line, as an N x 2 NumPy array
+
+
+# Distance from each point to the line segment from start to end (or to start, if the segment has no length)
+def point_segment_distances(points, start, end):
+    direction = end - start
+    length_squared = direction @ direction
+    if length_squared == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip(((points - start) @ direction) / length_squared, 0, 1)
+    closest = start + t[:, None] * direction
+    return np.hypot(*(points - closest).T)
+
+
+# Collapse runs of repeated points, returning the distinct points and how many times each one was repeated
+# add_line repeats a point to make a sharp corner, and add_pause repeats a point to wait
+def collapse_repeated_points(points):
+    if len(points) == 0:
+        return points, np.zeros(0, np.int64)
+    changes = np.any(points[1:] != points[:-1], axis=1)
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+    counts = np.diff(np.append(starts, len(points)))
+    return points[starts], counts
+
+
+# Ramer-Douglas-Peucker simplification
+# Returns a boolean mask of the points to keep, the first and last points are always kept
+def rdp_mask(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    if len(points) == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = point_segment_distances(points[first + 1:last], points[first], points[last])
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > tolerance:
+            split = first + 1 + furthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+# Simplify a line, keeping the repeated-point convention used for sharp corners and pauses
+# Repeated points are treated as one, simplified with RDP, then the points that survive are repeated as before
+def simplify_line(points, tolerance):
+    distinct, counts = collapse_repeated_points(points)
+    if len(distinct) < 3:
+        return points
+    keep = rdp_mask(distinct, tolerance)
+    return np.repeat(distinct[keep], counts[keep], axis=0)
+
+
+# The curved paths Nifty Ink actually draws through many lines' points, as polylines, worked out for all lines at once.
+# The lines are given as all their points (an M x 2 array) and offsets where each line starts (plus one for the end).
+# Nifty Ink draws a quadratic bezier curve from each midpoint to the next, using the point between as the control point,
+# starting at the first point and finishing with a straight segment to the last point.
+# Each curve is sampled at steps + 1 points. Returns the polyline points, offsets where each polyline starts (plus one
+# for the end) and, for each line, how far the true curve can be from its polyline.
+def nifty_curves(points, offsets, steps=8):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    line_count = len(offsets) - 1
+    lengths = np.diff(offsets)
+    present = lengths > 0
+    first = np.zeros(len(points), dtype=bool)
+    first[offsets[:-1][present]] = True
+    last = np.zeros(len(points), dtype=bool)
+    last[offsets[1:][present] - 1] = True
+
+    # A curve for every point but the last of each line, which is its control point
+    controls_index = np.flatnonzero(~last)
+    curve_lines = np.repeat(np.arange(line_count), np.maximum(lengths - 1, 0))
+    controls = points[controls_index]
+    midpoints = (controls + points[controls_index + 1]) / 2
+    previous_midpoints = (points[controls_index - 1] + controls) / 2
+    starts = np.where(first[controls_index, None], controls, previous_midpoints)
+
+    t = np.linspace(0, 1, steps + 1)[None, :, None]
+    curves = ((1 - t) ** 2 * starts[:, None] + 2 * t * (1 - t) * controls[:, None] + t ** 2 * midpoints[:, None])
+
+    # Curves whose control point lies on the straight line between their ends (such as the sharp corners from
+    # add_line, where the control point is repeated) are straight, so only need their end points
+    chords, control_offsets = midpoints - starts, controls - starts
+    cross = chords[:, 0] * control_offsets[:, 1] - chords[:, 1] * control_offsets[:, 0]
+    along = np.sum(chords * control_offsets, axis=1)
+    straight = (cross == 0) & (along >= 0) & (along <= np.sum(chords * chords, axis=1))
+    sample_mask = np.ones(curves.shape[:2], dtype=bool)
+    sample_mask[straight, 1:-1] = False
+
+    # Put each line's curve samples in order, followed by its last point
+    sample_keys = (controls_index[:, None] * (steps + 2) + np.arange(steps + 1))[sample_mask]
+    last_index = np.flatnonzero(last)
+    order = np.argsort(np.concatenate((sample_keys, last_index * (steps + 2))), kind="stable")
+    curve_points = np.concatenate((curves[sample_mask], points[last_index]))[order]
+    curve_lengths = np.bincount(np.repeat(curve_lines, sample_mask.sum(axis=1)), minlength=line_count) + present
+    curve_offsets = np.concatenate(([0], np.cumsum(curve_lengths)))
+
+    # Sampling a quadratic evenly is accurate to within a quarter of |start - 2 * control + end| / steps^2
+    second_differences = starts - 2 * controls + midpoints
+    errors = np.zeros(line_count)
+    np.maximum.at(errors, curve_lines, np.hypot(*second_differences.T))
+    return curve_points, curve_offsets, errors / (4 * steps ** 2)
+
+
+# Distances from the centres of a square grid of cells to many polylines (given as all their points and the offsets
+# where each one starts, plus one for the end), for every cell whose centre is within reach (one per polyline) of them.
+# cell_centres are the centres along each axis, cells are numbered y * len(cell_centres) + x.
+# Yields (polyline numbers, cell numbers, distances) in chunks of about chunk_cells cells checked, so memory stays
+# bounded. Each segment is checked separately, so a cell can come up more than once for the same polyline.
+def polylines_grid_distances(points, offsets, reach, cell_centres, chunk_cells=1 << 20):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    # A polyline with a single point is a single segment with no length
+    segment_counts = np.maximum(lengths - 1, lengths > 0)
+    segment_lines = np.repeat(np.arange(len(lengths)), segment_counts)
+    segment_starts = (np.repeat(offsets[:-1] - np.cumsum(segment_counts) + segment_counts, segment_counts) +
+                      np.arange(len(segment_lines)))
+    starts = points[segment_starts]
+    directions = points[segment_starts + (lengths[segment_lines] > 1)] - starts
+    lengths_squared = np.sum(directions * directions, axis=1)
+    segment_reach = np.asarray(reach, dtype=np.float64)[segment_lines]
+
+    # Window of cells around each segment that could be within reach
+    low = np.searchsorted(cell_centres, np.minimum(starts, starts + directions) - segment_reach[:, None])
+    high = np.searchsorted(cell_centres, np.maximum(starts, starts + directions) + segment_reach[:, None],
+                           side="right")
+    widths = np.maximum(high - low, 0)
+    cell_counts = widths[:, 0] * widths[:, 1]
+    cumulative_counts = np.cumsum(cell_counts)
+
+    first = 0
+    while first < len(segment_lines):
+        checked_before = cumulative_counts[first] - cell_counts[first]
+        last = max(int(np.searchsorted(cumulative_counts, checked_before + chunk_cells, side="right")), first + 1)
+        chunk = np.arange(first, last)
+        first = last
+
+        # Every (segment, cell) pair in the chunk, with the cells of each window filling it row by row
+        segments = np.repeat(chunk, cell_counts[chunk])
+        within = np.arange(len(segments)) - np.repeat(cumulative_counts[chunk] - cell_counts[chunk] - checked_before,
+                                                      cell_counts[chunk])
+        xs = low[segments, 0] + within % widths[segments, 0]
+        ys = low[segments, 1] + within // widths[segments, 0]
+
+        relative = np.stack((cell_centres[xs], cell_centres[ys]), axis=1) - starts[segments]
+        segment_directions = directions[segments]
+        segment_lengths = lengths_squared[segments]
+        t = np.clip(np.sum(relative * segment_directions, axis=1) / np.where(segment_lengths > 0, segment_lengths, 1),
+                    0, 1)
+        closest = relative - t[:, None] * segment_directions
+        distances = np.hypot(closest[:, 0], closest[:, 1])
+        near = distances <= segment_reach[segments]
+        yield segment_lines[segments[near]], (ys * len(cell_centres) + xs)[near], distances[near]
+
+
+# Join several lines (N x 2 arrays) into one line that Nifty Ink draws the same way.
+# Where one line ends on the point the next starts from they are simply joined together. Otherwise both of those
+# points are repeated, so the old ends stay exactly in place and the gap is crossed by a straight segment.
+def join_lines(lines):
+    if len(lines) == 1:
+        return lines[0]
+    parts = [lines[0]]
+    for previous, line in zip(lines, lines[1:]):
+        if np.any(previous[-1] != line[0]):
+            parts.append(np.stack((previous[-1], line[0])))
+        parts.append(line)
+    return np.concatenate(parts)
+
+
+# Whether the straight segment between two points stays at least margin away from the canvas
+# Only checks for both points being beyond the same edge, which is enough for hops around the outside of the canvas
+def segment_off_canvas(start, end, canvas_size, margin):
+    return bool(np.any((np.maximum(start, end) < -margin) | (np.minimum(start, end) > canvas_size + margin)))
+
+
+# Clip a line to the part of it that can be seen on the canvas, returning a list of lines (N x 2 arrays).
+# Each piece of the path Nifty Ink draws (a bezier curve from midpoint to midpoint, or the final straight segment)
+# stays inside the bounding box of its start, control and end points, so pieces whose box is more than the brush
+# radius off the canvas can't be seen. Each run of visible pieces becomes a line from the point before the run to
+# the point after it, which draws exactly the same curves, plus short straight ends hidden off the canvas.
+# Runs separated by fewer than min_gap hidden points are kept together, as a new line costs more than a few points.
+# With split=False only the hidden ends are trimmed off, leaving at most one line.
+def clip_line(points, brush_radius, canvas_size, split=True, min_gap=4):
+    if len(points) < 2:
+        visible = np.all((points >= -brush_radius) & (points <= canvas_size + brush_radius))
+        return [points] if visible else []
+
+    midpoints = (points[:-1] + points[1:]) / 2
+    starts = np.concatenate((points[:1], midpoints))
+    controls = points
+    ends = np.concatenate((midpoints, points[-1:]))
+    lower = np.minimum(np.minimum(starts, controls), ends)
+    upper = np.maximum(np.maximum(starts, controls), ends)
+    visible = np.all((upper >= -brush_radius) & (lower <= canvas_size + brush_radius), axis=1)
+    if visible.all():
+        return [points]
+    if not visible.any():
+        return []
+
+    # Runs of visible pieces, as (first, last) piece numbers
+    changes = np.diff(np.concatenate(([0], visible.astype(np.int8), [0])))
+    runs = list(zip(np.flatnonzero(changes == 1).tolist(), (np.flatnonzero(changes == -1) - 1).tolist()))
+    if not split:
+        runs = [(runs[0][0], runs[-1][1])]
+    joined = [runs[0]]
+    for first, last in runs[1:]:
+        if first - joined[-1][1] - 3 < min_gap:
+            joined[-1] = (joined[-1][0], last)
+        else:
+            joined.append((first, last))
+
+    last_point = len(points) - 1
+    return [points[max(first - 1, 0):min(last + 1, last_point) + 1] for first, last in joined]
@@ -0,0 +1,145 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .helper_fns import bezier_step_sizes
+from .polyline_helper_fns import collapse_repeated_points
+
+
+# Helper functions for rasterising Nifty Ink lines with NumPy and PIL, without pygame or a display.
+# NumPy works out the path each line follows, PIL draws it as a mask and paints the colour through the mask.
+
+
+# The path Nifty Ink draws through a line's points (N x 2 array, in pixels), as a polyline.
+# Each quadratic bezier curve, from midpoint to midpoint with the point between as the control point, is split into
+# just enough straight segments to stay within tolerance of it, then the path finishes straight to the last point.
+def nifty_path(points, tolerance=0.25):
+    if len(points) < 2:
+        return points
+    midpoints = (points[:-1] + points[1:]) / 2
+    starts = np.concatenate((points[:1], midpoints[:-1]))
+    controls = points[:-1]
+    segments = bezier_step_sizes(np.stack((starts, controls, midpoints), axis=1), tolerance) - 1
+
+    # Sample each curve at t = 0, 1 / k, ... (k - 1) / k, as the end of each curve is the start of the next
+    curves = np.repeat(np.arange(len(segments)), segments)
+    t = (np.arange(len(curves)) - np.repeat(np.cumsum(segments) - segments, segments)) / segments[curves]
+    t = t[:, None]
+    path = (1 - t) ** 2 * starts[curves] + 2 * t * (1 - t) * controls[curves] + t ** 2 * midpoints[curves]
+    return np.concatenate((path, midpoints[-1:], points[-1:]))
+
+
+# Whole pixel box around the points, widened by reach and limited to the region (x0, y0, x1, y1)
+# Returns None if the box misses the region
+def _clipped_box(points, reach, region):
+    lower = np.floor(points.min(axis=0) - reach)
+    upper = np.ceil(points.max(axis=0) + reach)
+    box = (max(int(lower[0]), region[0]), max(int(lower[1]), region[1]),
+           min(int(upper[0]), region[2]), min(int(upper[1]), region[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+# The rectangle around each segment of a polyline, radius out to either side, as (x, y) corners in order
+def _segment_quads(points, radius):
+    directions = np.diff(points, axis=0)
+    normals = np.stack((-directions[:, 1], directions[:, 0]), axis=1)
+    normals *= radius / np.hypot(normals[:, :1], normals[:, 1:])
+    starts, ends = points[:-1], points[1:]
+    return np.stack((starts + normals, ends + normals, ends - normals, starts - normals), axis=1).reshape(-1, 8)
+
+
+# The inner points of a polyline where it turns enough that the straight pieces of a stroke radius wide would leave
+# a visible wedge shaped gap (over a quarter of a pixel wide) on the outside of the turn, so need a round joint
+def _visible_joints(points, radius):
+    directions = np.diff(points, axis=0)
+    lengths = np.hypot(directions[:, 0], directions[:, 1])
+    cosines = np.sum(directions[:-1] * directions[1:], axis=1) / (lengths[:-1] * lengths[1:])
+    # The gap is 2 * radius * sin(turn / 2) wide, and sin(turn / 2) = sqrt((1 - cos(turn)) / 2)
+    widths = 2 * radius * np.sqrt(np.clip((1 - cosines) / 2, 0, 1))
+    return points[1:-1][widths > 0.25]
+
+
+# Mask of the pixels a stroke covers, limited to the region (x0, y0, x1, y1), as a PIL "L" image.
+# The stroke is everything within radius of the path, with round caps and joins, and (as in Nifty Ink) each pixel
+# is only covered once, however many times the path crosses it.
+# With supersample above 1 the mask is drawn that many times larger each way and shrunk, to antialias the edges.
+# Returns the mask and the box it covers, or None if the stroke misses the region.
+def stroke_mask(path, radius, region, supersample=1):
+    line_box = _clipped_box(path, radius + 1, region)
+    if line_box is None:
+        return None
+    x0, y0, x1, y1 = line_box
+
+    # PIL puts pixel centres on whole coordinates
+    points = (path - (x0, y0)) * supersample - 0.5
+    radius *= supersample
+    mask = Image.new("L", ((x1 - x0) * supersample, (y1 - y0) * supersample))
+    draw = ImageDraw.Draw(mask)
+    # PIL draws shapes with fractional coordinates differently depending on where the edge of the image cuts them,
+    # so give it whole (supersampled) pixel coordinates. Polygon coordinates are rounded down, as PIL would anyway.
+    for quad in np.floor(_segment_quads(points, radius)).tolist():
+        draw.polygon(quad, fill=255)
+    discs = np.concatenate((points[:1], _visible_joints(points, radius), points[-1:]))
+    for disc in np.round(np.concatenate((discs - radius, discs + radius), axis=1)).tolist():
+        draw.ellipse(disc, fill=255)
+
+    if supersample > 1:
+        mask = mask.reduce(supersample)
+    return mask, line_box
+
+
+# A region of an image being rendered, starting at the pixel origin (x, y), so a large image can also be drawn a tile
+# or band at a time. Lines are painted on with alpha compositing, with 8 bits per channel like a browser canvas.
+# With a transparent background, the colours are kept premultiplied by the alpha, which is kept separately,
+# so painting a colour through a mask is a plain blend for both.
+class Canvas:
+    def __init__(self, width, height, origin=(0, 0), transparent=False):
+        self.origin = origin
+        self.colours = Image.new("RGB", (width, height), (0, 0, 0) if transparent else (255, 255, 255))
+        self.alpha = Image.new("L", (width, height), 0) if transparent else None
+
+    @property
+    def region(self):
+        x, y = self.origin
+        return x, y, x + self.colours.width, y + self.colours.height
+
+    # Paint a colour through a mask covering the box (x0, y0, x1, y1)
+    def paint(self, colour, mask, box):
+        r, g, b, a = colour
+        if a != 1:
+            mask = mask.point([round(value * a) for value in range(256)])
+        x, y = self.origin
+        box = (box[0] - x, box[1] - y, box[2] - x, box[3] - y)
+        self.colours.paste((round(r), round(g), round(b)), box, mask)
+        if self.alpha is not None:
+            self.alpha.paste(255, box, mask)
+
+    # Copy another canvas, such as a tile of this one, onto this one in its place
+    # Give a box (x0, y0, x1, y1) to only copy that part of it
+    def paste(self, canvas, box=None):
+        x, y = canvas.origin
+        box = box or canvas.region
+        crop_box = (box[0] - x, box[1] - y, box[2] - x, box[3] - y)
+        position = (box[0] - self.origin[0], box[1] - self.origin[1])
+        self.colours.paste(canvas.colours.crop(crop_box), position)
+        if self.alpha is not None:
+            self.alpha.paste(canvas.alpha.crop(crop_box), position)
+
+    # Draw one line (points in canvas coordinates), scaled up by scale
+    # tolerance is how far (in pixels) the straight segments drawn may be from the true curves
+    def draw_line(self, points, colour, brush_radius, scale=1, tolerance=0.25, supersample=1):
+        if colour[3] == 0 or len(points) == 0:
+            return
+        path, _ = collapse_repeated_points(nifty_path(np.asarray(points, dtype=np.float64) * scale, tolerance))
+        stroke = stroke_mask(path, brush_radius * scale, self.region, supersample)
+        if stroke is not None:
+            self.paint(colour, *stroke)
+
+    # The finished image, RGB or (with a transparent background) RGBA
+    def to_image(self):
+        if self.alpha is None:
+            return self.colours
+        colours = np.asarray(self.colours, dtype=np.float32)
+        alpha = np.asarray(self.alpha, dtype=np.float32)[:, :, None]
+        colours = np.divide(colours * 255, alpha, out=np.zeros_like(colours), where=alpha > 0)
+        rgba = np.concatenate((np.clip(np.round(colours), 0, 255), alpha), axis=2).astype(np.uint8)
+        return Image.fromarray(rgba, "RGBA")
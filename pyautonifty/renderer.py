@@ -1,4 +1,4 @@
-import datetime
+import math
 import os
 import time
 import numpy as np
@@ -10,7 +10,8 @@ os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = str()
 import pygame
 
 from .constants import BLACK, WHITE, DRAWING_SIZE, TITLE_BAR_HEIGHT, BORDER_WIDTH
-from .helper_fns import get_bezier_curve, alpha_blend
+from .helper_fns import get_bezier_curves, get_adaptive_bezier_curves, alpha_blend, string_to_colour, \
+    timestamped_filename
 
 
 class Renderer:
@@ -47,132 +48,189 @@ class Renderer:
         self.screen = pygame.display.set_mode((self.pygame_x, self.pygame_y))
         pygame.display.set_caption("Drawing Render")
 
+        # Scratch surfaces for drawing translucent lines on, by size
+        self._scratch_surfaces = {}
+
+    # The area of the screen a line (points in screen pixels) can draw on, as a Rect, or None if it is off the screen
+    def _line_area(self, points, brush_radius):
+        if not points:
+            return None
+        xs, ys = [x for x, _ in points], [y for _, y in points]
+        padding = brush_radius + 2
+        x0, y0 = max(int(min(xs) - padding), 0), max(int(min(ys) - padding), 0)
+        x1, y1 = min(int(max(xs) + padding) + 1, self.pygame_x), min(int(max(ys) + padding) + 1, self.pygame_y)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return pygame.Rect(x0, y0, x1 - x0, y1 - y0)
+
+    # A scratch surface at least width x height in size. Sizes are rounded up to powers of two,
+    # so a handful of surfaces are reused for every translucent line
+    def _scratch_surface(self, width, height):
+        size = (1 << max(width - 1, 63).bit_length(), 1 << max(height - 1, 63).bit_length())
+        if size not in self._scratch_surfaces:
+            self._scratch_surfaces[size] = pygame.Surface(size, 0, 32)
+        return self._scratch_surfaces[size]
+
     # Render the lines to preview in Pygame
     def render(self, drawing, filename="output.png", simulate=False, speed=None,
                allow_transparency=False, fake_transparency=False, proper_line_thickness=False, draw_as_bezier=False,
-               step_size=10, save_transparent_bg=False, green_screen_colour=(0, 177, 64, 255)):
+               step_size=10, save_transparent_bg=False, green_screen_colour=(0, 177, 64, 255), tolerance=None,
+               fps=60):
 
+        if fps is not None and fps < 0:
+            raise ValueError("fps must not be negative, use 0 or None for no frame rate cap")
         if step_size < 2:
             step_size = 2
 
         self.screen.fill(green_screen_colour) if save_transparent_bg else self.screen.fill(WHITE)
         pygame.display.update()  # Show the background, (so the screen isn't black on drawings that are slow to process)
 
-        def draw_line(surface, colour, start_point, end_point, width, end_caps=False):
+        # Draw a thick polyline, working out the quad around every segment for the whole line at once
+        # With end_caps, a disc is drawn at every point too, giving round ends and joints
+        # The shapes are worked out from the screen positions of the points, then moved by -origin to draw on a
+        # surface whose top left is at origin on the screen, so they come out the same as drawing on the screen
+        def draw_lines(surface, colour, pts, width, end_caps=False, origin=(0, 0)):
+            pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+            if len(pts) < 2:
+                return
             if end_caps:
-                pygame.draw.circle(surface, colour, start_point, width / 2)
-                pygame.draw.circle(surface, colour, end_point, width / 2)
-            if start_point == end_point:
+                distinct = np.concatenate(([True], np.any(pts[1:] != pts[:-1], axis=1)))
+                for point in (pts[distinct] - origin).tolist():
+                    pygame.draw.circle(surface, colour, point, width / 2)
+
+            directions = np.diff(pts, axis=0)
+            lengths = np.hypot(directions[:, 0], directions[:, 1])
+            moving = lengths > 0
+            rotated = np.stack((-directions[moving, 1], directions[moving, 0]), axis=1)
+            rotated *= width / 2 / lengths[moving, None]
+            starts, ends = pts[:-1][moving], pts[1:][moving]
+            quads = np.stack((starts + rotated, starts - rotated, ends - rotated, ends + rotated), axis=1) - origin
+            for quad in quads.tolist():
+                pygame.draw.polygon(surface, colour, quad, width=0)
+
+        # Draw the path Nifty Ink draws through the points, working out every bezier curve of the line in one go,
+        # and drawing them all (and the straight segment to the last point at the end) as one polyline
+        # With a tolerance (in pixels), each curve gets just enough points to stay that close to the true curve,
+        # instead of step_size points
+        def draw_quadratic_bezier_curve_line(surface, colour, pts, width, end_caps=False, step_size=40, tolerance=None,
+                                             origin=(0, 0)):
+            if not pts:
                 return
-            np.seterr(divide='ignore', invalid='ignore')
-            vec_start_point = np.array(start_point)
-            vec_end_point = np.array(end_point)
-            move_point = vec_end_point - vec_start_point
-            norm_move = move_point / np.linalg.norm(move_point)
-
-            rotated_vec = np.array((-norm_move[1], norm_move[0])) * width / 2
-            start_point_1 = vec_start_point + rotated_vec
-            start_point_2 = vec_start_point - rotated_vec
-            end_point_1 = vec_end_point + rotated_vec
-            end_point_2 = vec_end_point - rotated_vec
-
-            pygame.draw.polygon(surface, colour, [start_point_1, start_point_2, end_point_2, end_point_1], width=0)
-
-        def draw_lines(surface, colour, pts, width, end_caps=False):
-            last_point = None
-            for pt in pts:
-                if last_point:
-                    draw_line(surface, colour, last_point, pt, width, end_caps=end_caps)
-                last_point = pt
-
-        def get_midpoint(p1, p2):
-            x = (p1[0] + p2[0]) / 2
-            y = (p1[1] + p2[1]) / 2
-            return [x, y]
-
-        def draw_quadratic_bezier_curve_line(surface, colour, pts, width, end_caps=False, step_size=40):
-            if pts:
-                last_midpoint = pts[0]
-                midpoint = last_midpoint
-                p2 = last_midpoint
-
-                for i in range(len(pts)):
-                    p1 = pts[i]
-                    try:
-                        p2 = pts[i + 1]
-
-                        midpoint = get_midpoint(p1, p2)
-                        # TODO: Write some code to create an appropriate step_size, likely based on the bezier curve length
-                        bezier_curve_points = get_bezier_curve((last_midpoint, p1, midpoint), step_size=step_size,
-                                                               end_point=True)
-                        draw_lines(surface, colour, bezier_curve_points, width, end_caps=end_caps)
-
-                        last_midpoint = midpoint
-                    except IndexError:  # Draw the last point as a straight line to finish
-                        draw_line(surface, colour, midpoint, p2, width, end_caps=end_caps)
-
-        for line in drawing:
-            brush_radius = line["brushRadius"] * self.pygame_scale
-            if "rgba" in line["brushColor"]:
-                colour = [float(cell) for cell in list(line["brushColor"][5:-1].split(","))]
-                colour[3] *= 255
+            pts_array = np.array(pts, dtype=np.float64)
+            midpoints = (pts_array[:-1] + pts_array[1:]) / 2
+            last_midpoints = np.concatenate((pts_array[:1], midpoints))[:len(midpoints)]
+            control_points = np.stack((last_midpoints, pts_array[:-1], midpoints), axis=1)
+            if tolerance:
+                curves = get_adaptive_bezier_curves(control_points, tolerance)
             else:
-                colour = [float(cell) for cell in list(line["brushColor"][4:-1].split(","))]
-                colour.append(255)
-
-            points = []
-            if colour[3] != 255 and allow_transparency:  # If the brushColour is transparent, draw with transparency
-                target_surface = pygame.Surface((self.pygame_x, self.pygame_y), 0, 32)
-                if colour[:-1] != [0, 0, 0]:
-                    target_surface.set_colorkey(BLACK)
-                else:  # Handle the black edge case
-                    target_surface.set_colorkey(WHITE)
-                    target_surface.fill((255, 255, 255, 0))
-                target_surface.set_alpha(round(colour[3]))
+                curves = get_bezier_curves(control_points, step_size=step_size, end_point=True)
+            path = [np.reshape(curve, (-1, 2)) for curve in curves]
+            path.append(np.stack((midpoints[-1] if len(midpoints) else pts_array[0], pts_array[-1])))
+            draw_lines(surface, colour, np.concatenate(path), width, end_caps=end_caps, origin=origin)
+
+        # The window is refreshed (and events are handled) at most fps times a second, refreshing only the areas drawn on
+        # (with fps 0 or None, after every line). With a speed, each line is due speed / 100 seconds after the one
+        # before, and each frame shows the lines due by the time it is shown, so the playback runs at the same pace
+        # however fast the lines are drawn
+        frame_time = 1 / fps if fps else 0
+        line_time = speed / 100 if simulate and speed else 0
+        start = time.perf_counter()
+        next_frame = start + frame_time
+        dirty_rects = []
+
+        # The first frame time at or after t, frames are every frame_time seconds from the start
+        def frame_at_or_after(t):
+            if not frame_time:
+                return t
+            return start + math.ceil((t - start) / frame_time - 1e-9) * frame_time
+
+        # Show the areas drawn on since the last frame and handle events, returns False if the window was closed
+        def show_frame():
+            if simulate:
+                # Lots of small updates are slower than one big one
+                pygame.display.update(dirty_rects if len(dirty_rects) <= 32 else dirty_rects[0].unionall(dirty_rects))
+                dirty_rects.clear()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return False
+            return True
+
+        for index, line in enumerate(drawing):
+            due = start + index * line_time
+            now = time.perf_counter()
+            if index and (now >= next_frame or due > next_frame):
+                # Ahead of schedule, wait for the last frame before this line is due
+                if due > next_frame > now:
+                    time.sleep(next_frame - now)
+                if not show_frame():
+                    # Exits before the image is finished, does not take screenshot.
+                    return
+                next_frame = max(frame_at_or_after(time.perf_counter()), frame_at_or_after(due))
+
+            brush_radius = line["brushRadius"] * self.pygame_scale
+            r, g, b, a = string_to_colour(line["brushColor"])
+            colour = [r, g, b, a * 255]
+
+            points = [(point.x * self.pygame_scale, point.y * self.pygame_scale) for point in line["points"]]
+            transparent = colour[3] != 255 and allow_transparency
+            origin = (0, 0)
+            if transparent:  # If the brushColour is transparent, draw with transparency
+                # Draw on a scratch surface only as big as the line, then blend just that area onto the screen
+                area = self._line_area(points, brush_radius)
+                if area is None:  # Nothing to draw on the screen
+                    points = []
+                else:
+                    target_surface = self._scratch_surface(area.width, area.height)
+                    key_colour = BLACK if colour[:-1] != [0, 0, 0] else WHITE  # Handle the black edge case
+                    target_surface.set_colorkey(key_colour)
+                    target_surface.fill(key_colour, pygame.Rect(0, 0, area.width, area.height))
+                    target_surface.set_alpha(round(colour[3]))
+                    origin = area.topleft
             else:  # If the brushColour is opaque, draw with no transparency
                 if fake_transparency:
                     colour = alpha_blend(colour[3] / 255, colour[:-1], [255, 255, 255])
                 target_surface = self.screen
 
-            for index, point in enumerate(line["points"]):
-                this_point = (point.x * self.pygame_scale, point.y * self.pygame_scale)
-                points.append(this_point)
-                if not proper_line_thickness:
+            if not proper_line_thickness:
+                # Points on the target surface, moving them by a whole number of pixels is exact
+                surface_points = [(x - origin[0], y - origin[1]) for x, y in points] if transparent else points
+                for this_point in surface_points:
                     pygame.draw.circle(target_surface, colour, this_point, int(brush_radius))
 
-            if proper_line_thickness:
+            if not points:
+                pass
+            elif proper_line_thickness:
                 if draw_as_bezier:
-                    draw_quadratic_bezier_curve_line(target_surface, colour, points, brush_radius * 2,
-                                                     end_caps=True, step_size=step_size)
+                    draw_quadratic_bezier_curve_line(target_surface, colour, points, brush_radius * 2, end_caps=True,
+                                                     step_size=step_size, tolerance=tolerance, origin=origin)
                 else:
-                    draw_lines(target_surface, colour, points, brush_radius * 2, end_caps=True)
+                    draw_lines(target_surface, colour, points, brush_radius * 2, end_caps=True, origin=origin)
             else:
-                pygame.draw.lines(target_surface, colour, False, points, int(brush_radius * 2))
+                pygame.draw.lines(target_surface, colour, False, surface_points, int(brush_radius * 2))
 
             # Required for transparency
-            if colour[3] != 255 and allow_transparency:
-                self.screen.blit(target_surface, (0, 0))
-
-            # Update the drawing line by line to see the drawing process
-            if simulate:
-                pygame.display.update()
-                if speed and speed != 0:
-                    time.sleep(speed / 100)
-
-            # Ensure that no events, such as pygame being closed are ignored.
-            ev = pygame.event.get()
-            for event in ev:
-                if event.type == pygame.QUIT:
-                    # Exits before the image is finished, does not take screenshot.
-                    return
-
-        # update screen to render the final result of the drawing
-        pygame.display.update()
+            if transparent and points:
+                self.screen.blit(target_surface, area.topleft, pygame.Rect(0, 0, area.width, area.height))
+
+            # Remember the area drawn on, to refresh just that part of the window in the next frame
+            if simulate and points:
+                changed_area = area if transparent else self._line_area(points, brush_radius)
+                if changed_area is not None:
+                    dirty_rects.append(changed_area)
+
+        if simulate:
+            # Show the last lines in their own frame, no sooner than they are due
+            now = time.perf_counter()
+            if next_frame > now:
+                time.sleep(next_frame - now)
+            if not show_frame():
+                return
+        else:
+            # update screen to render the final result of the drawing
+            pygame.display.update()
 
         # format the filename to include the time how the user chooses
-        current_time = datetime.datetime.now()
-        filename = filename.replace('%s', str(int(current_time.timestamp())))
-        formatted_filename = current_time.strftime(filename)
+        formatted_filename = timestamped_filename(filename)
 
         # TODO: Figure out if Pygame has a method to save a surface with a transparent background
         if save_transparent_bg:
@@ -0,0 +1,195 @@
+import heapq
+import math
+
+import numpy as np
+
+
+# Helper functions for choosing the order lines are drawn in, working on per line arrays of
+# start points, end points and bounding boxes (N x 2 arrays, bounding boxes already widened by the brush radius).
+#
+# To keep the picture the same, a line may only be drawn once every earlier line it could overlap has been drawn.
+# Overlaps are found with a grid: each grid cell has a queue of the lines whose bounding box touches it,
+# in their original order, and a line is ready once it is at the front of the queue of every cell it touches.
+# This is conservative (lines touching the same cell are treated as overlapping), so the z-order is never changed.
+# Among the ready lines, the next one is picked by one of two strategies:
+#   nearest - the line whose start point is closest to where the pen is, found by searching the grid outwards
+#   sweep   - the next line along a Hilbert curve over the canvas, sweeping back and forth, much faster but longer
+
+
+# Grid resolution to use for a given number of lines, aiming for a handful of lines per cell
+def stroke_order_resolution(line_count):
+    return int(np.clip(math.sqrt(line_count / 4), 16, 256))
+
+
+# Position of each point along a Hilbert curve filling the canvas, as an integer key
+# Sorting by the key visits points that are close together on the canvas one after another
+def hilbert_keys(points, canvas_size, order=16):
+    side = 1 << order
+    scaled = np.clip(np.nan_to_num(points) / canvas_size * side, 0, side - 1).astype(np.int64)
+    x, y = scaled[:, 0], scaled[:, 1]
+    keys = np.zeros(len(points), dtype=np.int64)
+    half = side >> 1
+    while half > 0:
+        right, top = (x & half) > 0, (y & half) > 0
+        keys += half * half * ((3 * right) ^ top)
+        # Rotate the quadrant so the curve inside it lines up with the next level
+        flip = right & ~top
+        x, y = np.where(flip, half - 1 - x, x), np.where(flip, half - 1 - y, y)
+        x, y = np.where(top, x, y), np.where(top, y, x)
+        half >>= 1
+    return keys
+
+
+# Work out which lines must wait for which, from the grid cells their bounding boxes touch.
+# In each cell, every line must wait for the line before it in that cell. Returns the lines waiting for each line
+# (as a flat list with offsets into it) and how many of those waits each line has (0 if it is ready straight away).
+def _overlap_successors(lower, upper, resolution, canvas_size):
+    count = len(lower)
+    cell_size = canvas_size / resolution
+    first = np.clip(np.floor(lower / cell_size), 0, resolution - 1).astype(np.int64)
+    last = np.clip(np.floor(upper / cell_size), 0, resolution - 1).astype(np.int64)
+
+    # Every (cell, line) pair, with the cells of each line filling its bounding box row by row
+    widths = last[:, 0] - first[:, 0] + 1
+    cell_counts = widths * (last[:, 1] - first[:, 1] + 1)
+    lines = np.repeat(np.arange(count), cell_counts)
+    within = np.arange(len(lines)) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+    cells = ((first[lines, 1] + within // widths[lines]) * resolution + first[lines, 0] + within % widths[lines])
+
+    # Sort the pairs into the queue for each cell, in drawing order, and pair each line with the one after it
+    queue_order = np.lexsort((lines, cells))
+    cells, lines = cells[queue_order], lines[queue_order]
+    same_cell = cells[1:] == cells[:-1]
+    predecessors, successors = lines[:-1][same_cell], lines[1:][same_cell]
+
+    by_predecessor = np.argsort(predecessors, kind="stable")
+    offsets = np.searchsorted(predecessors[by_predecessor], np.arange(count + 1))
+    waiting = np.bincount(successors, minlength=count)
+    return successors[by_predecessor].tolist(), offsets.tolist(), waiting.tolist()
+
+
+# Mark a line as drawn, so the lines waiting for it wait for one less line
+# Returns the lines that have become ready
+def _release(index, successors, offsets, waiting):
+    released = []
+    for following in successors[offsets[index]:offsets[index + 1]]:
+        waiting[following] -= 1
+        if waiting[following] == 0:
+            released.append(following)
+    return released
+
+
+# Order the given lines to cut down pen travel, without reordering lines whose bounding boxes share a grid cell
+# Returns the new order as a list of indices
+def stroke_order(starts, ends, lower, upper, canvas_size, method="nearest", resolution=None):
+    if len(starts) < 3:
+        return list(range(len(starts)))
+    resolution = resolution or stroke_order_resolution(len(starts))
+    if method == "nearest":
+        return _nearest_order(starts, ends, lower, upper, canvas_size, resolution)
+    if method == "sweep":
+        return _sweep_order(starts, lower, upper, canvas_size, resolution)
+    raise ValueError(f"Unknown stroke order method {method!r}, use 'nearest' or 'sweep'")
+
+
+# Greedy nearest neighbour: always draw the ready line that starts closest to the end of the last one
+def _nearest_order(starts, ends, lower, upper, canvas_size, resolution):
+    count = len(starts)
+    cell_size = canvas_size / resolution
+    successors, offsets, waiting = _overlap_successors(lower, upper, resolution, canvas_size)
+
+    start_cells = np.clip(np.floor(starts / cell_size), 0, resolution - 1).astype(np.int64)
+    start_cells = (start_cells[:, 1] * resolution + start_cells[:, 0]).tolist()
+    starts, ends = starts.tolist(), ends.tolist()
+
+    # Lines that are ready to draw, bucketed by the cell their start point is in, and all together
+    ready = [set() for _ in range(resolution * resolution)]
+    all_ready = set()
+
+    def make_ready(index):
+        ready[start_cells[index]].add(index)
+        all_ready.add(index)
+
+    for index in range(count):
+        if waiting[index] == 0:
+            make_ready(index)
+
+    # Closest ready start point to pos, searching rings of cells outwards until nothing closer can be found
+    # When only a few lines are ready it is quicker to check them all
+    def nearest(pos):
+        px, py = pos
+        if len(all_ready) <= 32:
+            return min(all_ready, key=lambda index: ((starts[index][0] - px) ** 2 + (starts[index][1] - py) ** 2, index))
+        cx = min(max(int(px // cell_size), 0), resolution - 1)
+        cy = min(max(int(py // cell_size), 0), resolution - 1)
+        # Anything in ring n of cells around the pen is at least this far plus n - 1 cells away
+        edge = max(0.0, min(px - cx * cell_size, (cx + 1) * cell_size - px,
+                            py - cy * cell_size, (cy + 1) * cell_size - py))
+        best, best_distance = None, math.inf
+        for ring in range(resolution):
+            if best is not None and best_distance <= (max(ring - 1, 0) * cell_size + edge) ** 2:
+                break
+            for y in range(max(cy - ring, 0), min(cy + ring, resolution - 1) + 1):
+                row = y * resolution
+                if ring == 0 or y == cy - ring or y == cy + ring:
+                    xs = range(max(cx - ring, 0), min(cx + ring, resolution - 1) + 1)
+                else:
+                    xs = [x for x in (cx - ring, cx + ring) if 0 <= x < resolution]
+                for x in xs:
+                    for index in ready[row + x]:
+                        sx, sy = starts[index]
+                        distance = (sx - px) ** 2 + (sy - py) ** 2
+                        if distance < best_distance or (distance == best_distance and index < best):
+                            best, best_distance = index, distance
+        return best
+
+    order = []
+    pos = starts[0]
+    while len(order) < count:
+        index = nearest(pos)
+        ready[start_cells[index]].discard(index)
+        all_ready.discard(index)
+        order.append(index)
+        pos = ends[index]
+        for following in _release(index, successors, offsets, waiting):
+            make_ready(following)
+    return order
+
+
+# Hilbert curve sweep: draw the ready lines in order along the curve, lines that only become ready once the sweep
+# has passed them wait for the next sweep, which goes back along the curve the other way
+def _sweep_order(starts, lower, upper, canvas_size, resolution):
+    count = len(starts)
+    successors, offsets, waiting = _overlap_successors(lower, upper, resolution, canvas_size)
+    keys = hilbert_keys(starts, canvas_size).tolist()
+
+    direction = 1
+    ahead = [(keys[index], index) for index in range(count) if waiting[index] == 0]
+    heapq.heapify(ahead)
+    behind = []
+
+    order = []
+    while len(order) < count:
+        if not ahead:
+            direction = -direction
+            ahead = [(-key, index) for key, index in behind]
+            heapq.heapify(ahead)
+            behind = []
+        current, index = heapq.heappop(ahead)
+        order.append(index)
+        for following in _release(index, successors, offsets, waiting):
+            key = direction * keys[following]
+            if key > current:
+                heapq.heappush(ahead, (key, following))
+            else:
+                behind.append((key, following))
+    return order
+
+
+# Total distance the pen moves between the end of each line and the start of the next, in the given order
+def travel_distance(starts, ends, order):
+    order = np.asarray(order, dtype=np.int64)
+    if len(order) < 2:
+        return 0.0
+    hops = starts[order[1:]] - ends[order[:-1]]
+    return float(np.sum(np.hypot(hops[:, 0], hops[:, 1])))
@@ -0,0 +1,45 @@
+import pytest
+
+from pyautonifty.drawing import Drawing
+from pyautonifty.pos import Pos
+
+BLACK = (0, 0, 0, 1)
+
+
+# A line that starts on the canvas, goes a long way off the left edge, and comes back on again,
+# so it crosses the canvas edge twice
+def edge_crossing_points():
+    return ([Pos(300 - 50 * step, 300) for step in range(20)] +
+            [Pos(300 - 50 * step, 700) for step in range(19, -1, -1)])
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_line_crossing_the_edge_twice_is_split(array_backed):
+    drawing = Drawing(array_backed)
+    drawing.add_line(edge_crossing_points(), BLACK, 5)
+    drawing.add_point(Pos(500, 500), BLACK, 5)
+    drawing.add_point(Pos(-500, 500), BLACK, 5)
+
+    report = drawing.clip_to_canvas()
+
+    assert report["lines_removed"] == 1
+    assert report["lines_split"] == 1
+    assert report["lines_added"] == 1
+    assert report["points_removed"] > 0
+    assert report["bytes_saved"] > 0
+    assert len(drawing) == 3
+    for line in list(drawing)[:2]:
+        assert min(pos.x for pos in line["points"]) > -100
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_translucent_lines_are_trimmed_but_not_split(array_backed):
+    drawing = Drawing(array_backed)
+    drawing.add_line(edge_crossing_points(), (0, 0, 0, 0.5), 5)
+
+    report = drawing.clip_to_canvas()
+
+    assert report["lines_removed"] == 0
+    assert report["lines_split"] == 0
+    assert report["lines_added"] == 0
+    assert len(drawing) == 1
@@ -0,0 +1,39 @@
+import pytest
+
+from pyautonifty.drawing import Drawing
+from pyautonifty.pos import Pos
+
+BLACK = (0, 0, 0, 1)
+RED = (255, 0, 0, 1)
+
+
+def make_drawing(array_backed):
+    drawing = Drawing(array_backed)
+    drawing.add_point(Pos(500, 500), BLACK, 10)  # hidden by the rectangle
+    drawing.add_straight_line(Pos(450, 450), Pos(550, 550), BLACK, 5)  # hidden by the rectangle
+    drawing.add_point(Pos(100, 100), BLACK, 10)  # nothing on top
+    drawing.add_point(Pos(700, 500), BLACK, 10)  # only under the translucent line
+    drawing.add_pause(5)
+    drawing.add_rounded_rectangle(Pos(500, 500), 300, 300, RED, 20, filled=True)
+    drawing.add_straight_line(Pos(650, 500), Pos(750, 500), (0, 0, 255, 0.5), 30)
+    return drawing
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_lines_under_opaque_lines_are_removed(array_backed):
+    drawing = make_drawing(array_backed)
+    report = drawing.cull_hidden_lines()
+
+    assert report["lines_removed"] == 2
+    assert report["bytes_saved"] > 0
+    assert [(line["points"][0].x, line["points"][0].y) for line in drawing][:3] == [(100, 100), (700, 500), (-10, -10)]
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_nothing_is_removed_without_cover(array_backed):
+    drawing = Drawing(array_backed)
+    drawing.add_point(Pos(500, 500), BLACK, 10)
+    drawing.add_point(Pos(500, 500), (255, 0, 0, 0.9), 20)
+    drawing.add_point(Pos(-300, -300), BLACK, 10)
+    assert drawing.cull_hidden_lines()["lines_removed"] == 0
+    assert len(drawing) == 3
@@ -0,0 +1,28 @@
+import math
+import random
+
+import pytest
+
+from pyautonifty.helper_fns import get_bezier_curve, get_bezier_curves
+
+
+# Each point worked out on its own, one term at a time
+def bezier_point(control_points, t):
+    degree = len(control_points) - 1
+    weights = [math.comb(degree, v) * t ** v * (1 - t) ** (degree - v) for v in range(degree + 1)]
+    return tuple(sum(point[axis] * weight for point, weight in zip(control_points, weights)) for axis in range(2))
+
+
+@pytest.mark.parametrize("degree", [1, 2, 3, 7])
+@pytest.mark.parametrize("end_point", [True, False])
+def test_bezier_curves_match_each_point_worked_out_alone(degree, end_point):
+    random.seed(degree)
+    curves = [[(random.uniform(-1000, 1000), random.randint(0, 3000) / 3) for _ in range(degree + 1)]
+              for _ in range(50)]
+    step_size = 10
+    steps = step_size - 1 if end_point else step_size
+    expected = [[bezier_point(curve, i / steps) for i in range(step_size)] for curve in curves]
+
+    assert [[tuple(point) for point in curve] for curve in get_bezier_curves(curves, step_size, end_point).tolist()] \
+        == expected
+    assert [get_bezier_curve(curve, step_size, end_point) for curve in curves] == expected
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from pyautonifty.drawing import Drawing
+from pyautonifty.pos import Pos
+
+
+# Lines with very different numbers of points, so the average cost of a point is a poor guide to any one part
+def make_drawing(array_backed):
+    rng = np.random.default_rng(7)
+    drawing = Drawing(array_backed)
+    for index in range(200):
+        point_count = int(rng.choice([1, 2, 5, 30, 100])) if index % 50 else 150
+        points = rng.uniform(0, 1000, (point_count, 2))
+        colour = tuple(rng.integers(0, 256, 3).tolist()) + (1,)
+        drawing.add_line([Pos(x, y) for x, y in points.tolist()], colour, float(rng.uniform(1, 20)))
+    return drawing
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+@pytest.mark.parametrize("compressed, max_bytes", [(True, 30000), (True, 60000), (False, 30000), (False, 150000)])
+def test_every_part_fits_in_max_bytes(tmp_path, array_backed, compressed, max_bytes):
+    drawing = make_drawing(array_backed)
+    file_names = drawing.write_nifty_import_parts(max_bytes, str(tmp_path / "part_{:03d}.txt"), compressed)
+
+    assert len(file_names) > 1
+    for file_name in file_names:
+        assert os.path.getsize(file_name) <= max_bytes
+
+
+def test_parts_hold_every_line(tmp_path):
+    drawing = make_drawing(True)
+    file_names = drawing.write_nifty_import_parts(50000, str(tmp_path / "part_{:03d}.txt"), compressed=False)
+
+    # The add layer imports mention brushRadius in their script as well as once for each line
+    empty = Drawing()
+    extra_mentions = [empty.to_nifty_import().count("brushRadius")] + \
+        [empty.to_nifty_add_layer_import().count("brushRadius")] * (len(file_names) - 1)
+    parts = [open(file_name, encoding="utf-8").read() for file_name in file_names]
+    assert sum(part.count("brushRadius") for part in parts) - sum(extra_mentions) == len(drawing)
+
+
+def test_line_too_big_for_a_part(tmp_path):
+    drawing = make_drawing(True)
+    with pytest.raises(ValueError):
+        drawing.write_nifty_import_parts(5000, str(tmp_path / "part_{:03d}.txt"), compressed=False)
@@ -0,0 +1,68 @@
+import pytest
+
+from pyautonifty.drawing import Drawing
+from pyautonifty.pos import Pos
+
+BLACK = (0, 0, 0, 1)
+RED = (255, 0, 0, 1)
+
+
+def line_arrays(drawing):
+    return [(points.tolist(), tuple(colour), radius) for points, colour, radius in drawing._iter_line_arrays()]
+
+
+def make_drawing(array_backed, colour, start):
+    drawing = Drawing(array_backed)
+    for step in range(5):
+        drawing.add_line([Pos(start + step * 10, 100), Pos(start + step * 10, 200)], colour, 5)
+    return drawing
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_adding_lines_after_a_layer_keeps_it_lazy(array_backed):
+    drawing = make_drawing(array_backed, BLACK, 0)
+    drawing + make_drawing(array_backed, RED, 500)
+    drawing.add_point(Pos(10, 10), BLACK, 5)
+    drawing.transform([[2, 0], [0, 2]])
+    drawing.add_point(Pos(20, 20), BLACK, 5)
+
+    assert drawing.layers
+    assert len(drawing) == 12
+
+    eager = make_drawing(array_backed, BLACK, 0)
+    for line in make_drawing(array_backed, RED, 500)._iter_line_arrays():
+        eager._add_line([Pos(x, y) for x, y in line[0].tolist()], line[1], line[2])
+    eager.add_point(Pos(10, 10), BLACK, 5)
+    eager.transform([[2, 0], [0, 2]])
+    eager.add_point(Pos(20, 20), BLACK, 5)
+    assert line_arrays(drawing) == line_arrays(eager)
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_changes_to_an_added_drawing_do_not_leak(array_backed):
+    child = make_drawing(array_backed, RED, 500)
+    drawing = make_drawing(array_backed, BLACK, 0) + child
+    expected = line_arrays(make_drawing(array_backed, BLACK, 0) + make_drawing(array_backed, RED, 500))
+
+    child.transform([[1, 0], [0, 1]], offset=(5, 5))
+    round(child)
+    child.add_point(Pos(10, 10), BLACK, 5)
+    child + make_drawing(array_backed, BLACK, 900)
+
+    assert line_arrays(drawing) == expected
+    assert len(child) == 11
+
+
+@pytest.mark.parametrize("array_backed", [False, True])
+def test_changes_to_the_result_do_not_reach_the_added_drawing(array_backed):
+    child = make_drawing(array_backed, RED, 500)
+    expected = line_arrays(child)
+    drawing = make_drawing(array_backed, BLACK, 0) + child
+
+    drawing.transform([[1, 0], [0, 1]], offset=(5, 5))
+    line_arrays(drawing)
+    drawing.scale(2)
+    drawing + drawing
+    line_arrays(drawing)
+
+    assert line_arrays(child) == expected
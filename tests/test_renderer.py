@@ -0,0 +1,77 @@
+import random
+import time
+
+import pygame
+import pytest
+
+from examples.alpha_example import alpha_example
+from pyautonifty.drawing import Drawing
+from pyautonifty.pos import Pos
+from pyautonifty.renderer import Renderer
+
+BLACK = (0, 0, 0, 1)
+
+
+def make_drawing(line_count):
+    drawing = Drawing()
+    for index in range(line_count):
+        drawing.add_point(Pos(10 + index * 20, 500), BLACK, 5)
+    return drawing
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    return Renderer(headless=True, pygame_scale=0.25)
+
+
+# Record when the window is refreshed
+@pytest.fixture
+def update_times(monkeypatch):
+    times = []
+    update = pygame.display.update
+
+    def timed_update(*args):
+        times.append(time.perf_counter())
+        return update(*args)
+
+    monkeypatch.setattr(pygame.display, "update", timed_update)
+    return times
+
+
+@pytest.mark.parametrize("fps", [0, None])
+def test_no_fps_refreshes_after_every_line(renderer, update_times, tmp_path, fps):
+    renderer.render(make_drawing(5), filename=str(tmp_path / "output.png"), simulate=True, fps=fps)
+
+    # The background, then one frame for each line
+    assert len(update_times) == 6
+
+
+def test_negative_fps_is_rejected(renderer, tmp_path):
+    with pytest.raises(ValueError):
+        renderer.render(make_drawing(1), filename=str(tmp_path / "output.png"), simulate=True, fps=-1)
+
+
+def test_last_frame_waits_for_its_frame_time(renderer, update_times, tmp_path):
+    start = time.perf_counter()
+    renderer.render(make_drawing(5), filename=str(tmp_path / "output.png"), simulate=True, fps=5)
+
+    assert len(update_times) == 2
+    assert update_times[-1] - start >= 0.2
+
+
+# Lines with an alpha just under 1 are drawn through a scratch surface and blended at full opacity,
+# so they must come out exactly as drawing the same lines straight onto the screen
+@pytest.mark.parametrize("options", [{}, {"proper_line_thickness": True},
+                                     {"proper_line_thickness": True, "draw_as_bezier": True}])
+def test_translucent_lines_match_drawing_on_the_screen(renderer, tmp_path, options):
+    images = []
+    for alpha in (1, 0.999):
+        random.seed(1)
+        drawing = alpha_example(Drawing())
+        for line in drawing:
+            line["brushColor"] = line["brushColor"][:3] + (alpha,)
+        filename = str(tmp_path / f"output_{alpha}.png")
+        renderer.render(drawing, filename=filename, allow_transparency=True, **options)
+        images.append(pygame.image.tostring(pygame.image.load(filename), "RGB"))
+
+    assert images[0] == images[1]